@@ -0,0 +1,85 @@
+"""Response and result caching (Redis, or in-memory when unset)."""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.config import get_settings
+
+settings = get_settings()
+
+_initialized = False
+
+
+def init_cache():
+    """Initialize the cache backend. Safe to call more than once."""
+    global _initialized
+    if _initialized:
+        return
+
+    if settings.redis_url:
+        from redis import asyncio as aioredis
+        backend = RedisBackend(aioredis.from_url(settings.redis_url))
+    else:
+        backend = InMemoryBackend()
+
+    FastAPICache.init(backend, prefix="fission")
+    _initialized = True
+
+
+def project_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: Tuple[Any, ...] = (),
+    kwargs: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Key cached responses on the project only.
+
+    The default builder hashes every argument, including the per-request
+    DB session, so nothing would ever hit.
+    """
+    project_id = str((kwargs or {}).get("project_id")).lower()
+    return f"{namespace}:{project_id}:{func.__name__}"
+
+
+async def invalidate_project_cache(namespace: str, project_id: Any):
+    """Drop cached responses in a namespace for one project."""
+    if not _initialized:
+        return
+    try:
+        await FastAPICache.clear(namespace=f"{namespace}:{str(project_id).lower()}")
+    except Exception as e:
+        print(f"[Cache] Invalidation failed for {namespace}:{project_id}: {e}")
+
+
+async def get_cached_json(key: str) -> Optional[Any]:
+    """Read a JSON value stored with set_cached_json; None on miss or error."""
+    if not _initialized:
+        return None
+    try:
+        raw = await FastAPICache.get_backend().get(f"{FastAPICache.get_prefix()}:{key}")
+    except Exception as e:
+        print(f"[Cache] Read failed for {key}: {e}")
+        return None
+    return orjson.loads(raw) if raw else None
+
+
+async def set_cached_json(key: str, value: Any, expire: int):
+    """Store a JSON-serializable value in the cache backend for expire seconds."""
+    if not _initialized:
+        return
+    try:
+        await FastAPICache.get_backend().set(
+            f"{FastAPICache.get_prefix()}:{key}", orjson.dumps(value), expire
+        )
+    except Exception as e:
+        print(f"[Cache] Write failed for {key}: {e}")
@@ -0,0 +1,46 @@
+"""Queue-backed logging for the app's service loggers."""
+
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+
+def configure_logging(level: int = logging.INFO):
+    """
+    Route the "app" loggers through a queue to a background writer thread.
+
+    Logging calls from concurrent pipeline tasks only enqueue the record;
+    the listener thread formats it and does the blocking stdout write.
+    Safe to call more than once (API lifespan and Celery worker start).
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+    _handler = QueueHandler(log_queue)
+    logger = logging.getLogger("app")
+    logger.addHandler(_handler)
+    logger.setLevel(level)
+    # The listener writes these; don't hand them to root (uvicorn/Celery) too
+    logger.propagate = False
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread (shutdown)."""
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger("app").removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _handler = None
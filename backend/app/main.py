@@ -1,60 +1,85 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from fastapi.responses import FileResponse, Response
+import asyncio
 import os
-import uuid
+from uuid import UUID
 from datetime import datetime
 
+from app.cache import init_cache
 from app.config import get_settings
-from app.models import get_db, create_tables, Project, Transcript, Moment, Asset
-from app.services.transcription import transcribe_video
-from app.services.analysis import analyze_transcript
-from app.services.video import extract_clip, create_vertical_version, add_captions
-from app.services.storage import upload_to_drive
+from app.logs import configure_logging, stop_logging
+from app.models import DBSessionMiddleware, create_tables
+from app.responses import FastJSONResponse
+from app.services.analysis import close_kimi_client
+from app.services.visual_generator import close_http_client
 
 settings = get_settings()
 
+DB_INIT_ATTEMPTS = 5
+DB_INIT_RETRY_SECONDS = 2
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize cache and database on startup; close shared clients on shutdown."""
+    print("App starting up...")
+    
+    configure_logging()
+    init_cache()
+    
+    # Try to init DB but don't fail startup if it stays unreachable
+    for attempt in range(1, DB_INIT_ATTEMPTS + 1):
+        try:
+            await asyncio.to_thread(create_tables)
+            print("Database initialized successfully")
+            break
+        except Exception as e:
+            print(f"Database init attempt {attempt}/{DB_INIT_ATTEMPTS} failed: {e}")
+            if attempt < DB_INIT_ATTEMPTS:
+                await asyncio.sleep(DB_INIT_RETRY_SECONDS)
+    else:
+        print("Database init warning: giving up, app will continue")
+    
+    # Without Celery, transcription runs in this process; load Whisper in
+    # the background so the first upload doesn't wait for it
+    if not settings.redis_url:
+        from app.services.transcription import preload_model
+        asyncio.get_running_loop().run_in_executor(None, preload_model)
+    
+    yield
+    
+    await close_kimi_client()
+    await close_http_client()
+    stop_logging()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Crucible Fission Reactor",
     description="Transform one video into 50+ content assets",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Update for production
+    allow_origin_regex=settings.cors_origin_regex,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Let browsers reuse preflight results for a day
 )
 
+# One lazily opened DB session per request
+app.add_middleware(DBSessionMiddleware)
+
 # Ensure temp directory exists
 os.makedirs(settings.temp_dir, exist_ok=True)
 
-# Serve video clips statically
-app.mount("/clips", StaticFiles(directory=settings.temp_dir), name="clips")
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database on startup."""
-    import asyncio
-    
-    # Just log startup - don't block on DB init
-    print("App starting up...")
-    
-    # Try to init DB but don't block or fail
-    try:
-        # Run in executor to not block event loop
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, create_tables)
-        print("Database initialized successfully")
-    except Exception as e:
-        print(f"Database init warning (app will continue): {e}")
-
 
 @app.get("/")
 async def root():
@@ -77,6 +102,27 @@ async def health_check():
     }
 
 
+@app.get("/clips/{project_id}/clips/{filename}")
+async def serve_clip(project_id: UUID, filename: str):
+    """Serve a generated clip (local fallback when Drive upload fails)."""
+    clips_dir = os.path.realpath(os.path.join(settings.temp_dir, str(project_id), "clips"))
+    path = os.path.realpath(os.path.join(clips_dir, filename))
+    
+    # Only files directly inside the project's clips directory
+    if os.path.commonpath([clips_dir, path]) != clips_dir or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Clip not found")
+    
+    # Let nginx stream the file from an internal location when configured
+    if settings.clips_accel_redirect_prefix:
+        relative = os.path.relpath(path, os.path.realpath(settings.temp_dir))
+        return Response(
+            headers={"X-Accel-Redirect": f"{settings.clips_accel_redirect_prefix.rstrip('/')}/{relative}"},
+            media_type="video/mp4"
+        )
+    
+    return FileResponse(path, media_type="video/mp4")
+
+
 # Import and include routers
 from app.routers import projects, upload, processing, assets, enhanced_processing
 
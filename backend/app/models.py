@@ -1,16 +1,42 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text, ForeignKey, JSON, DECIMAL
+from sqlalchemy import create_engine, insert, Column, String, DateTime, Integer, Text, ForeignKey, DECIMAL, Index, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import Session, sessionmaker, relationship, validates
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+import asyncio
 import uuid
+
+import orjson
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
 
 from app.config import get_settings
 
 settings = get_settings()
 
+
+def _json_serializer(value) -> str:
+    # JSONB payloads (story analysis, visual sourcing) can be large; orjson
+    # encodes them in C. Non-str keys are stringified the way json.dumps does.
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
 # Database setup
-engine = create_engine(settings.database_url)
+# Keep (pool_size + max_overflow) * workers below Postgres max_connections
+engine = create_engine(
+    settings.database_url,
+    poolclass=QueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=True,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
+    future=True
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,6 +44,16 @@ Base = declarative_base()
 class Project(Base):
     """Main project entity representing a video processing job."""
     __tablename__ = "projects"
+    __table_args__ = (
+        # Newest-first project listing
+        Index("ix_projects_created_at", text("created_at DESC")),
+        # Server-side lookups of metadata->'story_analysis'
+        Index(
+            "ix_projects_metadata_story",
+            text("(metadata -> 'story_analysis')"),
+            postgresql_using="gin"
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -25,7 +61,8 @@ class Project(Base):
     
     # Input
     input_video_url = Column(Text, nullable=True)
-    input_filename = Column(String(255))
+    input_filename = Column(String(255))  # As uploaded; display only
+    input_basename = Column(String(255))  # Generated name the file is stored under
     content_type = Column(String(50), default="testimonial")  # testimonial, case_study, founder_story
     
     # Status
@@ -37,7 +74,8 @@ class Project(Base):
     user_id = Column(UUID(as_uuid=True))
     duration_seconds = Column(Integer)
     file_size_mb = Column(DECIMAL(10, 2))
-    metadata = Column(JSON, default=dict)
+    # "metadata" is reserved by Declarative; MutableDict tracks in-place key writes
+    extra = Column("metadata", MutableDict.as_mutable(JSONB), default=dict)
     
     # Relationships
     transcript = relationship("Transcript", back_populates="project", uselist=False)
@@ -69,13 +107,17 @@ class Transcript(Base):
     
     full_text = Column(Text, nullable=False)
     language = Column(String(10), default="en")
-    segments = Column(JSON)  # [{"start": 0.0, "end": 5.5, "text": "..."}]
-    speakers = Column(JSON)  # [{"speaker": "Abby", "segments": []}]
+    segments = Column(JSONB)  # [{"start": 0.0, "end": 5.5, "text": "..."}]
+    speakers = Column(JSONB)  # [{"speaker": "Abby", "segments": []}]
 
 
 class Moment(Base):
     """Key moments identified in the transcript."""
     __tablename__ = "moments"
+    __table_args__ = (
+        # Top-N quotable moments per project
+        Index("ix_moments_project_score", "project_id", text("quotable_score DESC")),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -104,6 +146,9 @@ class Moment(Base):
 class Asset(Base):
     """Generated assets (videos, images, text)."""
     __tablename__ = "assets"
+    __table_args__ = (
+        Index("ix_assets_project_type", "project_id", "asset_type"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -130,64 +175,185 @@ class Asset(Base):
     # Metadata
     format = Column(String(20))  # mp4, jpg, txt, etc
     status = Column(String(50), default="pending")  # pending, processing, completed, failed
-    metadata = Column(JSON, default=dict)
+    extra = Column("metadata", MutableDict.as_mutable(JSONB), default=dict)
+    
+    @validates("format")
+    def _normalize_format(self, key, value):
+        return value.lower() if value else value
+
+
+def bulk_insert(db: Session, model, rows: Sequence[Dict[str, Any]], returning: bool = False) -> List[Any]:
+    """
+    Insert many rows in one round trip per page.
+    
+    Uses an ORM bulk INSERT, which skips the unit of work and identity map and
+    goes out as multi-row VALUES batches (insertmanyvalues). With
+    ``returning`` the new rows come back as ORM objects in the order given.
+    Every row should have the same keys, otherwise the batch is split.
+    Does not commit; validators do not run.
+    """
+    if not rows:
+        return []
+    stmt = insert(model)
+    if returning:
+        return db.scalars(stmt.returning(model, sort_by_parameter_order=True), rows).all()
+    db.execute(stmt, rows)
+    return []
+
+
+class LazySession:
+    """
+    Request-scoped proxy that opens a Session on first attribute access.
+
+    Requests that never touch the database (cache hits, early 404s on
+    path validation) never check a connection out of the pool.
+    """
+
+    def __init__(self):
+        self._session: Optional[Session] = None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = SessionLocal()
+        return getattr(self._session, name)
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+_session_ctx: ContextVar[Optional[LazySession]] = ContextVar("db_session", default=None)
 
 
-def get_db():
-    """Database session generator."""
-    db = SessionLocal()
+class DBSessionMiddleware:
+    """ASGI middleware giving each HTTP request one lazily opened session."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        session = LazySession()
+        token = _session_ctx.set(session)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _session_ctx.reset(token)
+            if session.is_open:
+                # close() rolls back on the connection; keep it off the loop
+                await asyncio.to_thread(session.close)
+
+
+async def get_db():
+    """
+    Return the current request's session.
+    
+    Sessions are synchronous, so routes that only touch the database are
+    declared with plain ``def`` and run in FastAPI's threadpool rather than
+    blocking the event loop. This dependency is async so resolving it does
+    not take a threadpool hop of its own.
+    """
+    session = _session_ctx.get()
+    if session is None:
+        raise RuntimeError("DBSessionMiddleware is not installed")
+    return session
+
+
+def _migrate(conn, description: str, sql: str) -> bool:
+    """
+    Run one migration statement in its own transaction; False if it failed.
+    
+    On Postgres a failed statement aborts its transaction, so sharing one
+    would make every later step fail and the final commit roll them all
+    back. Each step commits (or rolls back) before the next one starts.
+    """
     try:
-        yield db
-    finally:
-        db.close()
+        conn.execute(text(sql))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"[DB Migration] Skipped {description}: {e}")
+        return False
 
 
 def create_tables():
     """Create all database tables."""
     Base.metadata.create_all(bind=engine)
     
-    # Migration: Schema updates (ignore errors if tables don't exist yet)
-    from sqlalchemy import text
+    # Project.input_basename is mapped, so every Project query fails without
+    # it; committed on its own so no other migration step can roll it back
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                ALTER TABLE projects 
+                ADD COLUMN IF NOT EXISTS input_basename VARCHAR(255);
+            """))
+    except Exception as e:
+        print(f"[DB Migration] Could not add projects.input_basename: {e}")
+    
+    # Migration: Schema updates (failures are reported, not fatal)
     try:
         with engine.connect() as conn:
             # Make input_video_url nullable
-            try:
-                conn.execute(text("""
-                    ALTER TABLE projects 
-                    ALTER COLUMN input_video_url DROP NOT NULL;
-                """))
-            except Exception:
-                pass  # Column may already be nullable or table doesn't exist
+            _migrate(conn, "projects.input_video_url nullable", """
+                ALTER TABLE projects 
+                ALTER COLUMN input_video_url DROP NOT NULL;
+            """)
             
             # Make processing_stage Text instead of String(100)
-            try:
-                conn.execute(text("""
-                    ALTER TABLE projects 
-                    ALTER COLUMN processing_stage TYPE TEXT;
-                """))
-            except Exception:
-                pass
-            
-            # Add metadata column to projects if it doesn't exist
-            try:
-                conn.execute(text("""
-                    ALTER TABLE projects 
-                    ADD COLUMN IF NOT EXISTS metadata JSON DEFAULT '{}';
-                """))
-                print("[DB Migration] Added metadata column to projects table")
-            except Exception:
-                pass
+            _migrate(conn, "projects.processing_stage to TEXT", """
+                ALTER TABLE projects 
+                ALTER COLUMN processing_stage TYPE TEXT;
+            """)
             
-            # Add metadata column to assets if it doesn't exist
-            try:
-                conn.execute(text("""
-                    ALTER TABLE assets 
-                    ADD COLUMN IF NOT EXISTS metadata JSON DEFAULT '{}';
-                """))
-                print("[DB Migration] Added metadata column to assets table")
-            except Exception:
-                pass
+            # Add metadata columns if they don't exist
+            for table_name in ('projects', 'assets'):
+                _migrate(conn, f"{table_name}.metadata column", f"""
+                    ALTER TABLE {table_name} 
+                    ADD COLUMN IF NOT EXISTS metadata JSONB DEFAULT '{{}}';
+                """)
             
+            # Convert JSON columns created before the switch to JSONB
+            json_columns = conn.execute(text("""
+                SELECT table_name, column_name FROM information_schema.columns
+                WHERE data_type = 'json'
+                AND table_name IN ('projects', 'assets', 'transcripts');
+            """)).all()
             conn.commit()
+            for table_name, column_name in json_columns:
+                if _migrate(conn, f"{table_name}.{column_name} to JSONB", f"""
+                    ALTER TABLE {table_name}
+                    ALTER COLUMN {column_name} TYPE JSONB USING {column_name}::jsonb;
+                """):
+                    print(f"[DB Migration] Converted {table_name}.{column_name} to JSONB")
+            
+            # Indexes for per-project lookups (create_all skips existing tables)
+            _migrate(conn, "ix_assets_project_type", """
+                CREATE INDEX IF NOT EXISTS ix_assets_project_type
+                ON assets (project_id, asset_type);
+            """)
+            _migrate(conn, "ix_moments_project_score", """
+                CREATE INDEX IF NOT EXISTS ix_moments_project_score
+                ON moments (project_id, quotable_score DESC);
+            """)
+            _migrate(conn, "ix_projects_created_at", """
+                CREATE INDEX IF NOT EXISTS ix_projects_created_at
+                ON projects (created_at DESC);
+            """)
+            # Needs projects.metadata as JSONB (converted above)
+            _migrate(conn, "ix_projects_metadata_story", """
+                CREATE INDEX IF NOT EXISTS ix_projects_metadata_story
+                ON projects USING gin ((metadata -> 'story_analysis'));
+            """)
     except Exception as e:
         print(f"[DB Migration] Migration warnings (non-critical): {e}")
+
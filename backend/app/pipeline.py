@@ -0,0 +1,312 @@
+"""
+Video processing pipeline, split into stages.
+
+Each stage takes and returns a small JSON-serializable payload
+(project_id, file_path and the IDs produced so far) and loads whatever it
+needs from the database, so stages can run as separate Celery tasks or
+in-process via process_video. Every stage gets its own short-lived
+session; nothing request-scoped is ever handed to a stage.
+
+Transcription and analysis run in order; the asset stages only need the
+transcript and moments, so they fan out and run concurrently:
+
+    transcribe -> analyze -> {story, clips, text_assets, visuals} -> complete
+"""
+
+import asyncio
+import os
+import uuid
+from typing import Any, Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.cache import invalidate_project_cache
+from app.config import get_settings
+from app.models import SessionLocal, Asset, Moment, Project, Transcript, bulk_insert
+
+settings = get_settings()
+
+Payload = Dict[str, Any]
+
+# Max in-flight visual generations (image/stock API rate limits)
+VISUALS_CONCURRENCY = 4
+
+
+def _get_project(db: Session, payload: Payload) -> Project:
+    project = db.query(Project).filter(Project.id == uuid.UUID(payload["project_id"])).first()
+    if not project:
+        raise LookupError(f"Project {payload['project_id']} not found")
+    return project
+
+
+def _set_stage(db: Session, project: Project, stage: str, progress: int):
+    project.status = "processing"
+    project.processing_stage = stage
+    project.progress_percent = progress
+    db.commit()
+
+
+def _load_transcript_result(db: Session, payload: Payload) -> Dict[str, Any]:
+    transcript = db.query(Transcript).filter(
+        Transcript.id == uuid.UUID(payload["transcript_id"])
+    ).first()
+    return {
+        "transcript_id": str(transcript.id),
+        "full_text": transcript.full_text,
+        "language": transcript.language,
+        "segments": transcript.segments or [],
+    }
+
+
+def _load_moments(db: Session, payload: Payload) -> List[Moment]:
+    """Load this run's moments, in the order analysis produced them."""
+    ids = [uuid.UUID(m) for m in payload.get("moment_ids", [])]
+    if not ids:
+        return []
+    by_id = {m.id: m for m in db.query(Moment).filter(Moment.id.in_(ids)).all()}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+async def transcribe_stage(payload: Payload, db: Session) -> Payload:
+    """Stage 1: Transcription."""
+    from app.services.transcription import transcribe_video
+
+    project = _get_project(db, payload)
+    _set_stage(db, project, "transcribing", 15)
+
+    transcript_result = await transcribe_video(payload["file_path"], payload["project_id"], db)
+    return {**payload, "transcript_id": transcript_result["transcript_id"]}
+
+
+async def analyze_stage(payload: Payload, db: Session) -> Payload:
+    """Stage 2: Moment analysis."""
+    from app.services.analysis import analyze_transcript
+
+    project = _get_project(db, payload)
+    _set_stage(db, project, "analyzing", 35)
+
+    transcript_result = _load_transcript_result(db, payload)
+    moments = await analyze_transcript(transcript_result, payload["project_id"], db)
+    
+    # Asset stages run concurrently from here
+    _set_stage(db, project, "generating_assets", 45)
+    return {**payload, "moment_ids": [str(m.id) for m in moments]}
+
+
+async def story_stage(payload: Payload, db: Session) -> Payload:
+    """Story arc analysis and stitching (non-critical)."""
+    project = _get_project(db, payload)
+
+    project_id = payload["project_id"]
+    file_path = payload["file_path"]
+
+    try:
+        from app.services.story_arcs import analyze_story_structure
+        from app.services.video import stitch_clips
+
+        story_analysis = analyze_story_structure(_load_transcript_result(db, payload))
+
+        # Store story analysis in project metadata (with error handling)
+        try:
+            if project.extra is None:
+                project.extra = {}
+            project.extra['story_analysis'] = story_analysis
+            db.commit()
+        except Exception as metadata_error:
+            db.rollback()
+            print(f"[Pipeline] Warning: Could not save metadata: {metadata_error}")
+            # Continue processing even if metadata save fails
+
+        print(f"[Pipeline] Story analysis complete: {story_analysis.get('arcs_identified', 0)} arcs identified")
+
+        # Generate stitched story clips
+        suggestions = story_analysis.get('clip_suggestions', [])
+        print(f"[Pipeline] Generating {len(suggestions)} stitched story clips...")
+
+        async def stitch(i: int, suggestion: Dict[str, Any]):
+            story_name = suggestion.get('name', f'story_{i+1}')
+            segments = suggestion['segments']
+            output_path = os.path.join(
+                settings.temp_dir,
+                str(project_id),
+                "clips",
+                f"story_{story_name}.mp4"
+            )
+
+            print(f"[Pipeline] Stitching story '{story_name}' with {len(segments)} segments...")
+
+            # Stitches run concurrently, so each gets its own session
+            with SessionLocal() as stitch_db:
+                asset = await stitch_clips(
+                    video_path=file_path,
+                    segments=segments,
+                    output_path=output_path,
+                    project_id=project_id,
+                    story_name=story_name,
+                    db=stitch_db,
+                    add_transitions=False  # Simple concat for reliability
+                )
+                if asset:
+                    print(f"[Pipeline] Created story clip: {asset.file_url}")
+
+        stitches = []
+        for i, suggestion in enumerate(suggestions[:3]):  # Top 3 stories
+            segments = suggestion.get('segments', [])
+            if len(segments) < 2:
+                print(f"[Pipeline] Skipping story {i+1}: only {len(segments)} segment")
+                continue
+            stitches.append((i, stitch(i, suggestion)))
+
+        # Independent FFmpeg jobs; overlap them across cores
+        results = await asyncio.gather(*(coro for _, coro in stitches), return_exceptions=True)
+        for (i, _), result in zip(stitches, results):
+            if isinstance(result, Exception):
+                print(f"[Pipeline] Error stitching story {i+1}: {result}")
+
+    except Exception as e:
+        print(f"[Pipeline] Story analysis/stitching error (non-critical): {e}")
+
+    return payload
+
+
+async def clips_stage(payload: Payload, db: Session) -> Payload:
+    """Per-moment video clips."""
+    from app.services.video import extract_moment_clips
+
+    moments = _load_moments(db, payload)
+    await extract_moment_clips(moments, payload["file_path"], payload["project_id"], db)
+    return payload
+
+
+async def text_assets_stage(payload: Payload, db: Session) -> Payload:
+    """Text assets."""
+    from app.services.analysis import generate_text_assets
+
+    moments = _load_moments(db, payload)
+    transcript_result = _load_transcript_result(db, payload)
+    await generate_text_assets(moments, transcript_result, payload["project_id"], db)
+    return payload
+
+
+async def visuals_stage(payload: Payload, db: Session) -> Payload:
+    """Visual content generation (non-critical)."""
+    project_id = payload["project_id"]
+
+    try:
+        from app.services.visual_generator import VisualContentGenerator, visual_file_columns
+        generator = VisualContentGenerator()
+        semaphore = asyncio.Semaphore(VISUALS_CONCURRENCY)
+
+        async def generate(moment: Moment):
+            async with semaphore:
+                return await generator.generate_content_visuals(
+                    content=moment.quotable_text,
+                    content_type='quote_card',
+                    save_dir=os.path.join(settings.temp_dir, str(project_id), "visuals")
+                )
+
+        # Generate visuals for top moments; independent API calls run together
+        moments = [m for m in _load_moments(db, payload)[:2] if m.quotable_text]
+        results = await asyncio.gather(*(generate(m) for m in moments), return_exceptions=True)
+
+        asset_rows = []
+        for i, (moment, visuals) in enumerate(zip(moments, results)):
+            if isinstance(visuals, Exception):
+                print(f"[Pipeline] Visual generation failed for moment {i+1}: {visuals}")
+                continue
+
+            if visuals['primary_visual']:
+                visual = visuals['primary_visual']
+
+                asset_rows.append({
+                    **visual_file_columns(visual),
+                    "project_id": project_id,
+                    "moment_id": moment.id,
+                    "asset_type": "visual_image",
+                    "title": f"AI Visual for Quote {i+1}",
+                    "description": f"{visual.asset_type}: {moment.quotable_text[:60]}...",
+                    "extra": {
+                        'sourcing': visuals['sourcing'],
+                        'ai_prompt': visuals.get('ai_prompt'),
+                        'confidence': visual.confidence,
+                        'source_url': visual.source_url
+                    },
+                    "status": "completed"
+                })
+                print(f"[Pipeline] Generated visual for moment {i+1}: {visuals['sourcing']}")
+
+        # One batched INSERT and one commit for all visuals
+        bulk_insert(db, Asset, asset_rows)
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+        print(f"[Pipeline] Visual generation error (non-critical): {e}")
+
+    return payload
+
+
+async def complete_stage(payload: Payload, db: Session) -> Payload:
+    """Mark the project completed once every asset stage has finished."""
+    project_id = payload["project_id"]
+    project = _get_project(db, payload)
+    project.status = "completed"
+    project.processing_stage = "completed"
+    project.progress_percent = 100
+    db.commit()
+
+    await invalidate_project_cache("assets", project_id)
+    return payload
+
+
+# Sequential stages, then the concurrent asset stages; the Celery canvas
+# in app.worker mirrors this
+SEQUENTIAL_STAGES = (transcribe_stage, analyze_stage)
+ASSET_STAGES = (story_stage, clips_stage, text_assets_stage, visuals_stage)
+
+
+async def run_stage(stage, payload: Payload) -> Payload:
+    """
+    Run one stage on a fresh session.
+    
+    Stages never share a Session (or each other's commits); a failure rolls
+    back only that stage's uncommitted changes.
+    """
+    with SessionLocal() as db:
+        try:
+            return await stage(payload, db)
+        except Exception:
+            db.rollback()
+            raise
+
+
+def mark_failed(project_id: str, error: BaseException):
+    """Record a pipeline failure using a fresh session."""
+    with SessionLocal() as db:
+        project = db.query(Project).filter(Project.id == uuid.UUID(project_id)).first()
+        if project:
+            project.status = "failed"
+            project.processing_stage = f"Error: {str(error)}"
+            db.commit()
+    print(f"Processing error for {project_id}: {error}")
+
+
+async def process_video(project_id: str, file_path: str):
+    """Run the pipeline in-process (fallback when no Celery broker is set)."""
+    payload: Payload = {"project_id": project_id, "file_path": file_path}
+    try:
+        for stage in SEQUENTIAL_STAGES:
+            payload = await run_stage(stage, payload)
+        
+        # Let every branch finish before surfacing the first failure
+        results = await asyncio.gather(
+            *(run_stage(stage, payload) for stage in ASSET_STAGES),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        
+        await run_stage(complete_stage, payload)
+    except Exception as e:
+        mark_failed(project_id, e)
@@ -0,0 +1,35 @@
+"""JSON response classes backed by orjson."""
+
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+
+def _default(obj: Any) -> Any:
+    # orjson handles UUID and datetime natively; Decimal needs a hand
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    orjson response that encodes UUID/datetime/Decimal in C.
+
+    Handlers return this directly with raw column values; FastAPI only runs
+    jsonable_encoder over plain return values.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class PrebuiltJSONResponse(ORJSONResponse):
+    """JSON response whose body was already encoded (e.g. by pydantic-core)."""
+
+    def render(self, content: bytes) -> bytes:
+        return content
@@ -0,0 +1,7 @@
+from fastapi import Path
+from typing import Annotated
+
+# Project IDs that are only filtered on and echoed back are kept as strings;
+# the pattern rejects malformed IDs without building a uuid.UUID
+UUID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+ProjectId = Annotated[str, Path(pattern=UUID_PATTERN)]
@@ -1,77 +1,87 @@
 """Assets router for downloading generated content."""
 
 import os
-from typing import List
+from types import MappingProxyType
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi_cache.decorator import cache
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.cache import project_key_builder
 from app.models import get_db, Asset, Project
+from app.responses import PrebuiltJSONResponse
+from app.routers import ProjectId
+from app.schemas import AssetContentOut, AssetListOut, AssetOut
 
 router = APIRouter()
 
+# Columns returned by asset listings, selected as plain rows (no ORM objects)
+ASSET_LIST_COLUMNS = (
+    Asset.id,
+    Asset.asset_type,
+    Asset.title,
+    Asset.description,
+    Asset.content,
+    Asset.file_url,
+    Asset.file_size_mb,
+    Asset.duration_seconds,
+    Asset.dimensions,
+    Asset.format,
+    Asset.status,
+    Asset.created_at,
+    Asset.moment_id,
+)
 
-@router.get("/project/{project_id}")
-async def list_project_assets(project_id: UUID, db: Session = Depends(get_db)):
+
+# Asset files are written once per asset ID, so clients may cache them forever
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Asset.format is lowercased on write
+_MIME_TYPES = MappingProxyType({
+    "mp4": "video/mp4",
+    "mov": "video/quicktime",
+    "webm": "video/webm",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "txt": "text/plain",
+    "json": "application/json",
+})
+
+
+@router.get("/project/{project_id}", response_model=AssetListOut)
+@cache(expire=30, namespace="assets", key_builder=project_key_builder)
+def list_project_assets(project_id: ProjectId, db: Session = Depends(get_db)):
     """List all assets for a project."""
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
+    if db.query(Project.id).filter(Project.id == project_id).scalar() is None:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    assets = db.query(Asset).filter(Asset.project_id == project_id).all()
+    # Plain rows validate straight into the schema (no ORM objects)
+    stmt = select(*ASSET_LIST_COLUMNS).where(Asset.project_id == project_id)
+    rows = db.execute(stmt).all()
     
-    return {
-        "project_id": str(project_id),
-        "assets": [
-            {
-                "id": str(a.id),
-                "asset_type": a.asset_type,
-                "title": a.title,
-                "description": a.description,
-                "content": a.content,
-                "file_url": a.file_url,
-                "file_size_mb": float(a.file_size_mb) if a.file_size_mb else None,
-                "duration_seconds": a.duration_seconds,
-                "dimensions": a.dimensions,
-                "format": a.format,
-                "status": a.status,
-                "created_at": a.created_at.isoformat() if a.created_at else None,
-                "moment_id": str(a.moment_id) if a.moment_id else None,
-            }
-            for a in assets
-        ]
-    }
-
-
-@router.get("/{asset_id}")
-async def get_asset(asset_id: UUID, db: Session = Depends(get_db)):
+    listing = AssetListOut(project_id=project_id, assets=rows)
+    return PrebuiltJSONResponse(listing.model_dump_json().encode())
+
+
+@router.get("/{asset_id}", response_model=AssetOut)
+def get_asset(asset_id: UUID, db: Session = Depends(get_db)):
     """Get asset details."""
     asset = db.query(Asset).filter(Asset.id == asset_id).first()
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
     
-    return {
-        "id": str(asset.id),
-        "project_id": str(asset.project_id),
-        "moment_id": str(asset.moment_id) if asset.moment_id else None,
-        "asset_type": asset.asset_type,
-        "title": asset.title,
-        "description": asset.description,
-        "content": asset.content,
-        "file_url": asset.file_url,
-        "file_size_mb": float(asset.file_size_mb) if asset.file_size_mb else None,
-        "duration_seconds": asset.duration_seconds,
-        "dimensions": asset.dimensions,
-        "format": asset.format,
-        "status": asset.status,
-        "created_at": asset.created_at.isoformat() if asset.created_at else None,
-    }
+    return PrebuiltJSONResponse(
+        AssetOut.model_validate(asset).model_dump_json().encode()
+    )
 
 
 @router.get("/{asset_id}/download")
-async def download_asset(asset_id: UUID, db: Session = Depends(get_db)):
+def download_asset(asset_id: UUID, request: Request, db: Session = Depends(get_db)):
     """Download asset file."""
     asset = db.query(Asset).filter(Asset.id == asset_id).first()
     if not asset:
@@ -79,59 +89,44 @@ async def download_asset(asset_id: UUID, db: Session = Depends(get_db)):
     
     # Check if file exists locally
     if asset.file_path and os.path.exists(asset.file_path):
-        filename = os.path.basename(asset.file_path)
-        media_type = _get_media_type(asset.format)
+        headers = {
+            "Cache-Control": ASSET_CACHE_CONTROL,
+            "ETag": f'"{asset.id}"',
+        }
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
         
         return FileResponse(
             path=asset.file_path,
-            filename=filename,
-            media_type=media_type
+            filename=os.path.basename(asset.file_path),
+            media_type=_get_media_type(asset.format),
+            headers=headers
         )
     
-    # If external URL exists, redirect to it
-    if asset.file_url:
+    # Otherwise redirect to the external copy. A saved visual's file_url is
+    # this route itself, so it falls back to the URL it was downloaded from
+    external_url = (asset.extra or {}).get('source_url') or asset.file_url
+    if external_url and not external_url.endswith(f"/api/assets/{asset.id}/download"):
         from fastapi.responses import RedirectResponse
-        return RedirectResponse(url=asset.file_url)
+        return RedirectResponse(url=external_url)
     
     raise HTTPException(status_code=404, detail="Asset file not available")
 
 
-@router.get("/{asset_id}/content")
-async def get_asset_content(asset_id: UUID, db: Session = Depends(get_db)):
+@router.get("/{asset_id}/content", response_model=AssetContentOut)
+def get_asset_content(asset_id: UUID, db: Session = Depends(get_db)):
     """Get text content for text-based assets (quotes, emails, social posts, etc)."""
     asset = db.query(Asset).filter(Asset.id == asset_id).first()
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
     
-    text_types = ["quote_card", "email", "social_post", "blog_outline", "captions"]
-    
-    if asset.asset_type in text_types:
-        return {
-            "id": str(asset.id),
-            "asset_type": asset.asset_type,
-            "title": asset.title,
-            "content": asset.content,
-        }
-    
-    # For video/audio, return metadata only
-    return {
-        "id": str(asset.id),
-        "asset_type": asset.asset_type,
-        "title": asset.title,
-        "content": asset.content,  # May contain transcript or description
-    }
+    # Text assets return their body; for video/audio content may hold a
+    # transcript or description
+    return PrebuiltJSONResponse(
+        AssetContentOut.model_validate(asset).model_dump_json().encode()
+    )
 
 
-def _get_media_type(format: str) -> str:
+def _get_media_type(format: Optional[str]) -> str:
     """Get MIME type for file format."""
-    mime_types = {
-        "mp4": "video/mp4",
-        "mov": "video/quicktime",
-        "webm": "video/webm",
-        "jpg": "image/jpeg",
-        "jpeg": "image/jpeg",
-        "png": "image/png",
-        "txt": "text/plain",
-        "json": "application/json",
-    }
-    return mime_types.get(format.lower(), "application/octet-stream")
+    return _MIME_TYPES.get(format, "application/octet-stream")
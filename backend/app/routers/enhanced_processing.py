@@ -5,17 +5,25 @@ Enhanced processing router with story arcs and visual generation.
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import Dict, Any, List
+import asyncio
 import os
+import uuid
 
-from app.models import get_db, Project, Transcript, Moment, Asset
+import anyio
+
+from app.cache import invalidate_project_cache
+from app.config import get_settings
+from app.models import get_db, Project, Transcript, Moment, Asset, bulk_insert
+from app.responses import FastJSONResponse
 from app.services.story_arcs import analyze_story_structure, StoryArcDetector
-from app.services.visual_generator import VisualContentGenerator
+from app.services.visual_generator import VisualContentGenerator, visual_file_columns
 
 router = APIRouter()
+settings = get_settings()
 
 
 @router.post("/analyze-story/{project_id}")
-async def analyze_project_story(
+def analyze_project_story(
     project_id: str,
     db: Session = Depends(get_db)
 ):
@@ -40,20 +48,19 @@ async def analyze_project_story(
     story_analysis = analyze_story_structure(transcript_result)
     
     # Store story arcs in project metadata
-    if not project.metadata:
-        project.metadata = {}
-    
-    project.metadata['story_analysis'] = story_analysis
+    if project.extra is None:
+        project.extra = {}
+    project.extra['story_analysis'] = story_analysis
     db.commit()
     
-    return {
+    return FastJSONResponse({
         "project_id": project_id,
         "story_analysis": story_analysis
-    }
+    })
 
 
 @router.post("/generate-story-clips/{project_id}")
-async def generate_story_based_clips(
+def generate_story_based_clips(
     project_id: str,
     db: Session = Depends(get_db)
 ):
@@ -61,14 +68,12 @@ async def generate_story_based_clips(
     Generate video clips based on story arcs instead of isolated moments.
     Creates stitched narratives.
     """
-    from app.services.video import extract_clip, stitch_clips
-    
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Get story analysis
-    story_analysis = project.metadata.get('story_analysis', {}) if project.metadata else {}
+    story_analysis = (project.extra or {}).get('story_analysis', {})
     suggestions = story_analysis.get('clip_suggestions', [])
     
     if not suggestions:
@@ -82,40 +87,44 @@ async def generate_story_based_clips(
             story_analysis = analyze_story_structure(transcript_result)
             suggestions = story_analysis.get('clip_suggestions', [])
     
-    # Generate clips for each suggestion
+    # Build every asset row up front and write them in one INSERT
     generated_clips = []
+    asset_rows = []
     
     for suggestion in suggestions[:3]:  # Top 3 story-based clips
-        # Create asset for this story clip
-        asset = Asset(
-            project_id=project_id,
-            asset_type="story_clip",
-            title=f"Story: {suggestion['name']}",
-            description=suggestion['description'],
-            metadata={
+        # TODO: Implement clip stitching
+        # For now, mark as ready for manual editing
+        asset_id = uuid.uuid4()  # Known before commit; no refresh to read it back
+        asset_rows.append({
+            "id": asset_id,
+            "project_id": project_id,
+            "asset_type": "story_clip",
+            "title": f"Story: {suggestion['name']}",
+            "description": suggestion['description'],
+            "content": f"Edit segments: {suggestion['segments']}",
+            "extra": {
                 'segments': suggestion['segments'],
                 'beats_used': suggestion['beats_used'],
                 'purpose': suggestion['purpose']
             },
-            status="processing"
-        )
-        db.add(asset)
-        db.commit()
-        
-        # TODO: Implement clip stitching
-        # For now, mark as ready for manual editing
-        asset.status = "ready_for_edit"
-        asset.content = f"Edit segments: {suggestion['segments']}"
-        db.commit()
+            "status": "ready_for_edit"
+        })
         
         generated_clips.append({
-            'asset_id': str(asset.id),
+            'asset_id': str(asset_id),
             'name': suggestion['name'],
             'segments': suggestion['segments'],
             'purpose': suggestion['purpose'],
             'description': suggestion['description']
         })
     
+    if asset_rows:
+        bulk_insert(db, Asset, asset_rows)
+        db.commit()
+    
+    # Sync route: runs in a worker thread, so hop back to the loop to invalidate
+    anyio.from_thread.run(invalidate_project_cache, "assets", project_id)
+    
     return {
         "project_id": project_id,
         "clips_generated": len(generated_clips),
@@ -135,19 +144,27 @@ async def generate_project_visuals(
     """
     generator = VisualContentGenerator()
     
-    project = db.query(Project).filter(Project.id == project_id).first()
+    # Blocking DB calls run in a worker thread so the loop keeps serving
+    project = await asyncio.to_thread(
+        db.query(Project).filter(Project.id == project_id).first
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Get top moments for visual generation
-    moments = db.query(Moment).filter(
-        Moment.project_id == project_id
-    ).order_by(Moment.quotable_score.desc()).all()
+    # Top 3 scored moments; matches ix_moments_project_score so Postgres
+    # reads just those rows off the index
+    moments = await asyncio.to_thread(
+        db.query(Moment).filter(
+            Moment.project_id == project_id,
+            Moment.quotable_score.isnot(None)
+        ).order_by(Moment.quotable_score.desc()).limit(3).all
+    )
     
     generated_visuals = []
+    asset_rows = []
     
     # Generate visuals for top 3 moments
-    for i, moment in enumerate(moments[:3]):
+    for i, moment in enumerate(moments):
         if not moment.quotable_text:
             continue
         
@@ -155,65 +172,76 @@ async def generate_project_visuals(
         visuals = await generator.generate_content_visuals(
             content=moment.quotable_text,
             content_type='quote_card',
-            client_assets=client_assets
+            client_assets=client_assets,
+            save_dir=os.path.join(settings.temp_dir, project_id, "visuals")
         )
         
         # Create asset for primary visual
         if visuals['primary_visual']:
             visual = visuals['primary_visual']
+            files = visual_file_columns(visual)
+            alt_files = [visual_file_columns(alt) for alt in visuals['alternatives'][:2]]
             
-            asset = Asset(
-                project_id=project_id,
-                moment_id=moment.id,
-                asset_type="visual_image",
-                title=f"Visual for Quote {i+1}",
-                description=f"{visual.asset_type}: {moment.quotable_text[:80]}...",
-                file_url=visual.source_url,
-                content=moment.quotable_text,
-                metadata={
+            asset_rows.append({
+                **files,
+                "project_id": project_id,
+                "moment_id": moment.id,
+                "asset_type": "visual_image",
+                "title": f"Visual for Quote {i+1}",
+                "description": f"{visual.asset_type}: {moment.quotable_text[:80]}...",
+                "content": moment.quotable_text,
+                "extra": {
                     'sourcing': visuals['sourcing'],
                     'keywords': visuals['keywords'],
                     'ai_prompt': visuals.get('ai_prompt'),
-                    'confidence': visual.confidence
+                    'confidence': visual.confidence,
+                    'source_url': visual.source_url
                 },
-                status="completed"
-            )
-            db.add(asset)
+                "status": "completed"
+            })
             
             # Create alternative visual assets
-            for j, alt in enumerate(visuals['alternatives'][:2]):
-                alt_asset = Asset(
-                    project_id=project_id,
-                    moment_id=moment.id,
-                    asset_type="visual_image_alt",
-                    title=f"Visual Alternative {i+1}.{j+1}",
-                    description=f"Alternative {alt.asset_type}",
-                    file_url=alt.source_url,
-                    metadata={
+            for j, (alt, alt_file) in enumerate(zip(visuals['alternatives'], alt_files)):
+                asset_rows.append({
+                    **alt_file,
+                    "project_id": project_id,
+                    "moment_id": moment.id,
+                    "asset_type": "visual_image_alt",
+                    "title": f"Visual Alternative {i+1}.{j+1}",
+                    "description": f"Alternative {alt.asset_type}",
+                    "content": None,  # Same keys as the primary rows keeps one batch
+                    "extra": {
                         'sourcing': alt.asset_type,
-                        'confidence': alt.confidence
+                        'confidence': alt.confidence,
+                        'source_url': alt.source_url
                     },
-                    status="completed"
-                )
-                db.add(alt_asset)
-            
-            db.commit()
+                    "status": "completed"
+                })
             
             generated_visuals.append({
                 'moment_id': str(moment.id),
                 'quote': moment.quotable_text[:100],
                 'primary_visual': {
-                    'url': visual.source_url,
+                    'url': files['file_url'],
                     'type': visual.asset_type,
                     'sourcing': visuals['sourcing']
                 },
                 'alternatives': [
-                    {'url': alt.source_url, 'type': alt.asset_type}
-                    for alt in visuals['alternatives'][:2]
+                    {'url': alt_file['file_url'], 'type': alt.asset_type}
+                    for alt, alt_file in zip(visuals['alternatives'], alt_files)
                 ],
                 'ai_prompt': visuals.get('ai_prompt')
             })
     
+    # Single INSERT and commit for all moments
+    if asset_rows:
+        def write_assets():
+            bulk_insert(db, Asset, asset_rows)
+            db.commit()
+        await asyncio.to_thread(write_assets)
+    
+    await invalidate_project_cache("assets", project_id)
+    
     return {
         "project_id": project_id,
         "visuals_generated": len(generated_visuals),
@@ -235,21 +263,29 @@ async def generate_quote_cards(
     """
     generator = VisualContentGenerator()
     
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = await asyncio.to_thread(
+        db.query(Project).filter(Project.id == project_id).first
+    )
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Get best moment
-    moment = db.query(Moment).filter(
-        Moment.project_id == project_id
-    ).order_by(Moment.quotable_score.desc()).first()
+    moment = await asyncio.to_thread(
+        db.query(Moment).filter(
+            Moment.project_id == project_id,
+            Moment.quotable_score.isnot(None)
+        ).order_by(Moment.quotable_score.desc()).first
+    )
     
     if not moment or not moment.quotable_text:
         raise HTTPException(status_code=404, detail="No quotable content found")
     
+    # Read before commit expires the instance (a refresh would block the loop)
+    quote = moment.quotable_text
+    
     # Generate quote card specification
     quote_card = await generator.generate_quote_card_visuals(
-        quote=moment.quotable_text,
+        quote=quote,
         brand_colors=brand_colors,
         logo_url=logo_url,
         client_assets=client_assets
@@ -261,8 +297,8 @@ async def generate_quote_cards(
         moment_id=moment.id,
         asset_type="quote_card_spec",
         title="Quote Card Design",
-        content=moment.quotable_text,
-        metadata={
+        content=quote,
+        extra={
             'quote_card_spec': quote_card,
             'brand_colors': brand_colors,
             'logo_url': logo_url
@@ -270,17 +306,19 @@ async def generate_quote_cards(
         status="completed"
     )
     db.add(asset)
-    db.commit()
+    await asyncio.to_thread(db.commit)
+    
+    await invalidate_project_cache("assets", project_id)
     
     return {
         "project_id": project_id,
-        "quote": moment.quotable_text,
+        "quote": quote,
         "quote_card": quote_card
     }
 
 
 @router.get("/story-suggestions/{project_id}")
-async def get_story_suggestions(
+def get_story_suggestions(
     project_id: str,
     db: Session = Depends(get_db)
 ):
@@ -292,7 +330,7 @@ async def get_story_suggestions(
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Get or generate story analysis
-    story_analysis = project.metadata.get('story_analysis', {}) if project.metadata else {}
+    story_analysis = (project.extra or {}).get('story_analysis', {})
     
     if not story_analysis:
         transcript = db.query(Transcript).filter(Transcript.project_id == project_id).first()
@@ -303,9 +341,9 @@ async def get_story_suggestions(
             }
             story_analysis = analyze_story_structure(transcript_result)
     
-    return {
+    return FastJSONResponse({
         "project_id": project_id,
         "beats": story_analysis.get('beats', []),
         "arcs": story_analysis.get('arcs', []),
         "clip_suggestions": story_analysis.get('clip_suggestions', [])
-    }
+    })
@@ -1,33 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from uuid import UUID
-from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi_cache.decorator import cache
+from sqlalchemy.orm import Session, joinedload, selectinload
 
+from app.cache import project_key_builder
 from app.models import get_db, Project
+from app.responses import FastJSONResponse
+from app.routers import ProjectId
+from app.worker import enqueue_processing
 
 router = APIRouter()
 
 
 @router.get("/status/{project_id}")
 @router.get("/status/{project_id}/")
-async def get_status(project_id: UUID, db: Session = Depends(get_db)):
+@cache(expire=2, namespace="status", key_builder=project_key_builder)
+def get_status(project_id: ProjectId, db: Session = Depends(get_db)):
     """Get processing status for a project."""
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    return {
-        "project_id": str(project.id),
+    return FastJSONResponse({
+        "project_id": project.id,
         "status": project.status,
         "processing_stage": project.processing_stage,
         "progress_percent": project.progress_percent,
-        "created_at": project.created_at.isoformat() if project.created_at else None,
-        "updated_at": project.updated_at.isoformat() if project.updated_at else None
-    }
+        "created_at": project.created_at,
+        "updated_at": project.updated_at
+    })
 
 
 @router.post("/{project_id}/retry")
-async def retry_processing(project_id: UUID, db: Session = Depends(get_db)):
+def retry_processing(
+    project_id: ProjectId,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """Retry failed processing."""
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
@@ -36,56 +44,67 @@ async def retry_processing(project_id: UUID, db: Session = Depends(get_db)):
     if project.status != "failed":
         raise HTTPException(status_code=400, detail="Can only retry failed projects")
     
+    if not project.input_video_url:
+        raise HTTPException(status_code=400, detail="Original upload is no longer available")
+    
     # Reset status
     project.status = "pending"
     project.processing_stage = "retry_queued"
     project.progress_percent = 0
     db.commit()
     
-    # TODO: Add to background processing queue
+    # The pipeline builds temp_dir paths and clip URLs from this id; use the
+    # canonical form, not the request path's spelling
+    enqueue_processing(str(project.id), project.input_video_url, background_tasks)
     
-    return {"message": "Project queued for retry", "project_id": str(project_id)}
+    return {"message": "Project queued for retry", "project_id": project_id}
 
 
 @router.get("/{project_id}/transcript")
-async def get_transcript(project_id: UUID, db: Session = Depends(get_db)):
+@cache(expire=30, namespace="transcript", key_builder=project_key_builder)
+def get_transcript(project_id: ProjectId, db: Session = Depends(get_db)):
     """Get transcript for a project."""
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = db.query(Project).options(
+        joinedload(Project.transcript)
+    ).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     if not project.transcript:
         raise HTTPException(status_code=404, detail="Transcript not yet available")
     
-    return {
-        "project_id": str(project.id),
+    return FastJSONResponse({
+        "project_id": project.id,
         "full_text": project.transcript.full_text,
         "language": project.transcript.language,
         "segments": project.transcript.segments
-    }
+    })
 
 
 @router.get("/{project_id}/moments")
-async def get_moments(project_id: UUID, db: Session = Depends(get_db)):
+def get_moments(project_id: ProjectId, db: Session = Depends(get_db)):
     """Get identified moments for a project."""
-    project = db.query(Project).filter(Project.id == project_id).first()
+    project = db.query(Project).options(
+        selectinload(Project.moments)
+    ).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     moments = [
         {
-            "id": str(m.id),
+            "id": m.id,
             "moment_type": m.moment_type,
-            "start_time": float(m.start_time),
-            "end_time": float(m.end_time),
+            "start_time": m.start_time,
+            "end_time": m.end_time,
             "transcript": m.transcript,
             "summary": m.summary,
-            "sentiment_score": float(m.sentiment_score) if m.sentiment_score else None,
-            "importance_score": float(m.importance_score) if m.importance_score else None,
+            "sentiment_score": m.sentiment_score,
+            "importance_score": m.importance_score,
             "quotable_text": m.quotable_text,
-            "quotable_score": float(m.quotable_score) if m.quotable_score else None
+            "quotable_score": m.quotable_score
         }
         for m in project.moments
     ]
     
-    return {"moments": moments}
+    # Decimal scores are encoded by the response class
+    return FastJSONResponse({"moments": moments})
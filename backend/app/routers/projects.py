@@ -1,24 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
 from typing import List
 from uuid import UUID
 
-from app.models import get_db, Project
+from app.models import get_db, Asset, Project
+from app.responses import FastJSONResponse
 
 router = APIRouter()
 
+# Asset fields shown on the project dashboard
+PROJECT_ASSET_COLUMNS = (
+    Asset.id,
+    Asset.asset_type,
+    Asset.title,
+    Asset.description,
+    Asset.content,
+    Asset.file_url,
+    Asset.duration_seconds,
+    Asset.status,
+)
+
 
 @router.get("/")
-async def list_projects(db: Session = Depends(get_db)):
-    """List all projects."""
-    projects = db.query(Project).order_by(Project.created_at.desc()).all()
+def list_projects(
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """List projects, newest first."""
+    # Only the columns Project.to_dict() reads
+    projects = db.query(Project).options(
+        load_only(
+            Project.id,
+            Project.created_at,
+            Project.status,
+            Project.processing_stage,
+            Project.progress_percent,
+            Project.content_type,
+            Project.duration_seconds,
+            Project.file_size_mb,
+        )
+    ).order_by(Project.created_at.desc()).limit(limit).offset(offset).all()
     return {
         "projects": [p.to_dict() for p in projects]
     }
 
 
 @router.get("/{project_id}")
-async def get_project(project_id: UUID, db: Session = Depends(get_db)):
+def get_project(project_id: UUID, db: Session = Depends(get_db)):
     """Get a specific project by ID."""
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
@@ -28,31 +58,22 @@ async def get_project(project_id: UUID, db: Session = Depends(get_db)):
 
 @router.get("/{project_id}/assets")
 @router.get("/{project_id}/assets/")
-async def get_project_assets(project_id: UUID, db: Session = Depends(get_db)):
+def get_project_assets(project_id: UUID, db: Session = Depends(get_db)):
     """Get all assets for a project."""
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    # Plain rows straight from a column SELECT; no ORM instances
+    rows = db.execute(
+        select(*PROJECT_ASSET_COLUMNS).where(Asset.project_id == project_id)
+    ).mappings().all()
     
-    assets = [
-        {
-            "id": str(a.id),
-            "asset_type": a.asset_type,
-            "title": a.title,
-            "description": a.description,
-            "content": a.content,
-            "file_url": a.file_url,
-            "duration_seconds": a.duration_seconds,
-            "status": a.status
-        }
-        for a in project.assets
-    ]
+    # Assets imply the project exists (FK); only an empty result needs the check
+    if not rows and db.query(Project.id).filter(Project.id == project_id).scalar() is None:
+        raise HTTPException(status_code=404, detail="Project not found")
     
-    return {"assets": assets}
+    return FastJSONResponse({"assets": [dict(row) for row in rows]})
 
 
 @router.post("/{project_id}/download-all")
-async def download_all_assets(project_id: UUID, db: Session = Depends(get_db)):
+def download_all_assets(project_id: UUID, db: Session = Depends(get_db)):
     """Generate ZIP file with all assets for download."""
     # TODO: Implement ZIP generation
     return {"message": "ZIP generation not yet implemented"}
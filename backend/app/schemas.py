@@ -0,0 +1,46 @@
+"""Pydantic response schemas, serialized by pydantic-core."""
+
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, ConfigDict
+
+
+class AssetSummary(BaseModel):
+    """Asset fields returned in project listings."""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: UUID
+    moment_id: Optional[UUID] = None
+    asset_type: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    content: Optional[str] = None
+    file_url: Optional[str] = None
+    file_size_mb: Optional[float] = None
+    duration_seconds: Optional[int] = None
+    dimensions: Optional[str] = None
+    format: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class AssetOut(AssetSummary):
+    """Full asset details."""
+    project_id: Optional[UUID] = None
+
+
+class AssetListOut(BaseModel):
+    project_id: str
+    assets: List[AssetSummary]
+
+
+class AssetContentOut(BaseModel):
+    """Text content of an asset."""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: UUID
+    asset_type: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
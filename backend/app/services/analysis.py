@@ -1,16 +1,58 @@
 """Analysis service using Kimi for moment identification and text generation."""
 
-import json
+import hashlib
+import heapq
+import logging
 import re
-from typing import Dict, Any, List, Tuple
+import string
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
+import ahocorasick
 import httpx
+import ijson
+import numpy as np
+import orjson
 
+from app.cache import get_cached_json, set_cached_json
 from app.config import get_settings
-from app.models import Moment, Asset
+from app.models import Moment, Asset, bulk_insert
 
 settings = get_settings()
 
+# Per-segment scoring diagnostics; enable DEBUG for this logger to see them
+log = logging.getLogger(__name__)
+
+# Kimi results are cached by transcript content; bump the version when the
+# prompt or model changes so stale analyses aren't reused
+KIMI_CACHE_VERSION = "v1"
+KIMI_CACHE_TTL = 7 * 86400
+
+# Shared Kimi client so keep-alive connections (and HTTP/2) are reused
+# across projects instead of paying a TCP + TLS handshake per call
+_kimi_client: Optional[httpx.AsyncClient] = None
+
+
+def get_kimi_client() -> httpx.AsyncClient:
+    """Return the shared Kimi client, creating it on first use."""
+    global _kimi_client
+    if _kimi_client is None or _kimi_client.is_closed:
+        _kimi_client = httpx.AsyncClient(
+            base_url=settings.moonshot_base_url,
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            headers={"Authorization": f"Bearer {settings.moonshot_api_key}"}
+        )
+    return _kimi_client
+
+
+async def close_kimi_client():
+    """Close the shared Kimi client (app shutdown)."""
+    global _kimi_client
+    if _kimi_client is not None:
+        await _kimi_client.aclose()
+        _kimi_client = None
+
 # Keywords that indicate valuable content vs filler/interviewer
 RESULT_KEYWORDS = [
     'increased', 'decreased', 'improved', 'doubled', 'tripled', 'grew', 'saved',
@@ -34,52 +76,121 @@ QUESTION_INDICATORS = [
     'what', 'when', 'where', 'why', 'how', 'tell me', 'explain'
 ]
 
+# Question starters are one or two words; match the segment's opening
+# word and word pair exactly instead of substring-scanning its first words
+_QUESTION_STARTERS = frozenset(QUESTION_INDICATORS)
+
+
+def _starts_with_question(words_lower: List[str]) -> bool:
+    """Whether the (already lowercased) words open with a question starter."""
+    if not words_lower:
+        return False
+    first = words_lower[0].strip(string.punctuation)
+    if first in _QUESTION_STARTERS:
+        return True
+    if len(words_lower) > 1:
+        pair = f"{first} {words_lower[1].strip(string.punctuation)}"
+        return pair in _QUESTION_STARTERS
+    return False
+
+
+# Specific results: "50%", "3 times", "$10k"; the alternatives share the
+# leading \d+ so the engine only tries them after a digit run
+_NUMBER_RE = re.compile(r'\d+(?:%| percent| x| times)|\$\d+')
+
+
+def _build_keyword_automaton() -> ahocorasick.Automaton:
+    # One trie over every scored keyword, so a segment is scanned once
+    # instead of once per keyword
+    categories: Dict[str, List[str]] = {}
+    for category, keywords in (
+        ("result", RESULT_KEYWORDS),
+        ("emotion", EMOTIONAL_KEYWORDS),
+        ("filler", FILLER_WORDS),
+    ):
+        for keyword in keywords:
+            categories.setdefault(keyword, []).append(category)
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, cats in categories.items():
+        automaton.add_word(keyword, (keyword, tuple(cats)))
+    automaton.make_automaton()
+    return automaton
+
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+
+def _keyword_hits(text_lower: str) -> Tuple[int, int, int]:
+    """
+    Count keyword hits in one pass over the text.
+    
+    Returns (result_matches, emotion_matches, filler_count): distinct result
+    and emotional keywords present, and total filler occurrences.
+    """
+    result_seen = set()
+    emotion_seen = set()
+    filler_count = 0
+    for _, (keyword, cats) in _KEYWORD_AUTOMATON.iter(text_lower):
+        for category in cats:
+            if category == "result":
+                result_seen.add(keyword)
+            elif category == "emotion":
+                emotion_seen.add(keyword)
+            else:
+                filler_count += 1
+    return len(result_seen), len(emotion_seen), filler_count
+
 
 def calculate_segment_quality(segment: Dict) -> Tuple[float, str]:
     """
     Calculate quality score for a segment.
     Returns (score, reason) where higher score = better content.
     """
-    text = segment.get('text', '').strip()
     duration = segment.get('end', 0) - segment.get('start', 0)
+    raw_text = segment.get('text', '')
     
+    # Penalty: Too short (< 3 seconds); decided before any string copies,
+    # though blank segments still report as empty
+    if duration < 3.0:
+        if not raw_text or raw_text.isspace():
+            return 0.0, "empty"
+        return 0.1, "too_short"
+    
+    text = raw_text.strip()
     if not text:
         return 0.0, "empty"
     
+    # Penalty: Ends with question mark (interviewer question)
+    if text.endswith('?'):
+        return 0.1, "is_question"
+    
+    # Only segments past the cheap rejects pay for lowercasing and splitting;
+    # the text is lowercased once and every later check reads that copy
     score = 0.0
     text_lower = text.lower()
-    words = text.split()
+    words = text_lower.split()
     word_count = len(words)
     
-    # Penalty: Too short (< 3 seconds)
-    if duration < 3.0:
-        return 0.1, "too_short"
-    
     # Penalty: Too long (> 45 seconds, probably rambling)
     if duration > 45.0:
         score -= 0.2
     
-    # Penalty: Ends with question mark (interviewer question)
-    if text.endswith('?'):
-        return 0.1, "is_question"
-    
     # Penalty: Starts with question words (likely question)
-    first_words = ' '.join(words[:3]).lower()
-    if any(q in first_words for q in QUESTION_INDICATORS):
+    if _starts_with_question(words):
         return 0.15, "starts_with_question"
     
+    result_matches, emotion_matches, filler_count = _keyword_hits(text_lower)
+    
     # Penalty: High filler word ratio
-    filler_count = sum(text_lower.count(filler) for filler in FILLER_WORDS)
     filler_ratio = filler_count / max(word_count, 1)
     if filler_ratio > 0.15:
         score -= 0.3
     
     # Bonus: Contains result keywords (specific outcomes)
-    result_matches = sum(1 for keyword in RESULT_KEYWORDS if keyword in text_lower)
     score += result_matches * 0.25
     
     # Bonus: Contains emotional keywords (enthusiasm)
-    emotion_matches = sum(1 for keyword in EMOTIONAL_KEYWORDS if keyword in text_lower)
     score += emotion_matches * 0.2
     
     # Bonus: Substantial duration (5-20 seconds is ideal)
@@ -92,46 +203,243 @@ def calculate_segment_quality(segment: Dict) -> Tuple[float, str]:
         score += 0.2
     
     # Bonus: Contains numbers (specific results)
-    if re.search(r'\d+%|\d+ percent|\d+ x|\d+ times|\$\d+', text):
+    if _NUMBER_RE.search(text):
         score += 0.4
     
     return max(score, 0.0), "quality"
 
 
+def _segment_durations(segments: List[Dict]) -> np.ndarray:
+    n = len(segments)
+    starts = np.fromiter((s.get('start', 0) for s in segments), dtype=np.float64, count=n)
+    ends = np.fromiter((s.get('end', 0) for s in segments), dtype=np.float64, count=n)
+    return ends - starts
+
+
+def _top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, largest first; ties keep input order."""
+    n = len(values)
+    if k <= 0 or n == 0:
+        return np.arange(0)
+    if n > k:
+        # O(n) selection: everything above the k-th largest value, then the
+        # earliest of the ties at that value
+        kth = np.partition(values, n - k)[n - k]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:k - len(above)]
+        top = np.concatenate((above, ties))
+    else:
+        top = np.arange(n)
+    return top[np.lexsort((top, -values[top]))]
+
+
+def score_segments_vectorized(segments: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every segment at once; same results as calculate_segment_quality.
+    
+    Text features (keyword hits, word counts, numbers) are gathered in one
+    pass, skipping segments an early reject already decides; the scoring
+    arithmetic then runs over whole arrays. Returns (scores, reasons).
+    """
+    n = len(segments)
+    durations = _segment_durations(segments)
+    
+    empty = np.zeros(n, dtype=bool)
+    is_question = np.zeros(n, dtype=bool)
+    starts_with_question = np.zeros(n, dtype=bool)
+    has_number = np.zeros(n, dtype=bool)
+    word_counts = np.zeros(n, dtype=np.int64)
+    result_hits = np.zeros(n, dtype=np.int64)
+    emotion_hits = np.zeros(n, dtype=np.int64)
+    filler_hits = np.zeros(n, dtype=np.int64)
+    
+    for i, seg in enumerate(segments):
+        raw_text = seg.get('text', '')
+        if durations[i] < 3.0:
+            empty[i] = not raw_text or raw_text.isspace()
+            continue
+        text = raw_text.strip()
+        if not text:
+            empty[i] = True
+            continue
+        if text.endswith('?'):
+            is_question[i] = True
+            continue
+        text_lower = text.lower()
+        words = text_lower.split()
+        if _starts_with_question(words):
+            starts_with_question[i] = True
+            continue
+        word_counts[i] = len(words)
+        result_hits[i], emotion_hits[i], filler_hits[i] = _keyword_hits(text_lower)
+        has_number[i] = _NUMBER_RE.search(text) is not None
+    
+    # Same terms, in the same order, as calculate_segment_quality
+    scores = np.where(durations > 45.0, -0.2, 0.0)
+    scores -= np.where(filler_hits / np.maximum(word_counts, 1) > 0.15, 0.3, 0.0)
+    scores += result_hits * 0.25
+    scores += emotion_hits * 0.2
+    scores += np.where((durations >= 5.0) & (durations <= 20.0), 0.3, 0.0)
+    words_per_second = word_counts / np.maximum(durations, 1)
+    scores += np.where((words_per_second >= 2.0) & (words_per_second <= 4.0), 0.2, 0.0)
+    scores += np.where(has_number, 0.4, 0.0)
+    scores = np.maximum(scores, 0.0)
+    
+    # Early rejects, in the scalar path's order of precedence
+    too_short = durations < 3.0
+    rejects = [empty, too_short, is_question, starts_with_question]
+    scores = np.select(rejects, [0.0, 0.1, 0.1, 0.15], scores)
+    reasons = np.select(
+        rejects,
+        ["empty", "too_short", "is_question", "starts_with_question"],
+        "quality"
+    )
+    return scores, reasons
+
+
+def _rank_segments(segments: List[Dict], max_segments: int) -> Tuple[List[int], List[float]]:
+    """Score all segments once; returns (indices of the best, every segment's score)."""
+    scores, reasons = score_segments_vectorized(segments)
+    
+    # Only segments above the quality threshold are considered
+    candidates = np.flatnonzero(scores > 0.3)
+    
+    if log.isEnabledFor(logging.DEBUG):
+        for seg, score, reason in zip(segments, scores.tolist(), reasons.tolist()):
+            if score > 0.3:
+                log.debug("Segment at %.1fs scored %.2f (%s): %.60s...", seg.get('start', 0), score, reason, seg.get('text', ''))
+            else:
+                log.debug("Skipped segment at %.1fs (score %.2f, %s)", seg.get('start', 0), score, reason)
+    
+    # Top segments by score descending
+    top = candidates[_top_k_indices(scores[candidates], max_segments)]
+    return top.tolist(), scores.tolist()
+
+
 def identify_best_segments(segments: List[Dict], max_segments: int = 5) -> List[Dict]:
     """
     Identify the best segments using heuristics.
     Returns segments sorted by quality score.
     """
-    scored_segments = []
+    best, _ = _rank_segments(segments, max_segments)
+    return [segments[i] for i in best]
+
+
+async def _stream_moment_objects(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield moment dicts from a streamed Kimi completion as each one closes.
     
-    for seg in segments:
-        score, reason = calculate_segment_quality(seg)
+    The content deltas are fed to an incremental JSON parser, so a moment is
+    available as soon as its closing brace arrives. Shapes that can't be
+    streamed (a single bare object) are parsed once the stream ends.
+    """
+    content_parts = []
+    events = None
+    parser = None
+    yielded = 0
+    
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
         
-        if score > 0.3:  # Only consider segments above quality threshold
-            scored_segments.append((score, seg))
-            print(f"[Quality] Segment at {seg.get('start', 0):.1f}s scored {score:.2f} ({reason}): {seg.get('text', '')[:60]}...")
-        else:
-            print(f"[Quality] Skipped segment at {seg.get('start', 0):.1f}s (score {score:.2f}, {reason})")
+        choice = orjson.loads(data)["choices"][0]
+        delta = choice.get("delta", {}).get("content")
+        if delta:
+            content_parts.append(delta)
+            
+            if parser is None:
+                head = "".join(content_parts).lstrip()
+                if head:
+                    # Array root, or the {"moments": [...]} wrapper json_object mode prefers
+                    prefix = "item" if head[0] == "[" else "moments.item"
+                    events = ijson.sendable_list()
+                    parser = ijson.items_coro(events, prefix, use_float=True)
+                    delta = head
+            
+            if parser:
+                try:
+                    parser.send(delta.encode())
+                except ijson.JSONError:
+                    parser = False  # Not clean JSON; parse the whole body at the end
+            
+            for obj in events or ():
+                yielded += 1
+                yield obj
+            if events:
+                del events[:]
+        
+        # The choice carrying finish_reason is the last content; don't wait
+        # on the trailing [DONE] event or the connection closing
+        if choice.get("finish_reason"):
+            break
     
-    # Sort by score descending
-    scored_segments.sort(key=lambda x: x[0], reverse=True)
+    if yielded:
+        return
+    
+    moments_data = orjson.loads("".join(content_parts))
     
-    # Return top segments
-    return [seg for score, seg in scored_segments[:max_segments]]
+    # Ensure it's a list
+    if isinstance(moments_data, dict) and "moments" in moments_data:
+        moments_data = moments_data["moments"]
+    elif not isinstance(moments_data, list):
+        moments_data = [moments_data]
+    
+    for obj in moments_data:
+        yield obj
 
 
-async def analyze_transcript(transcript_result: Dict[str, Any], project_id: str, db: Session) -> List[Moment]:
+def _moment_row_from_kimi(m_data: Dict[str, Any], project_id: str) -> Optional[Dict[str, Any]]:
+    """Validate one Kimi moment into Moment column values; None if it should be skipped."""
+    start_time = m_data.get("start_time", 0)
+    end_time = m_data.get("end_time", 0)
+    quotable_text = m_data.get("quotable_text", "")
+    
+    # Skip if it looks like a question
+    if quotable_text.strip().endswith('?'):
+        print(f"[Analysis] Skipping moment with question: {quotable_text[:50]}...")
+        return None
+    
+    # Skip if too short
+    if end_time - start_time < 3.0:
+        print(f"[Analysis] Skipping short moment ({end_time - start_time:.1f}s)")
+        return None
+    
+    return {
+        "project_id": project_id,
+        "moment_type": m_data.get("moment_type", "general"),
+        "start_time": start_time,
+        "end_time": end_time,
+        "transcript": quotable_text,
+        "summary": m_data.get("summary", ""),
+        "sentiment_score": m_data.get("sentiment_score", 0),
+        "importance_score": m_data.get("importance_score", 0.5),
+        "quotable_text": quotable_text,
+        "quotable_score": m_data.get("quotable_score", 0.5)
+    }
+
+
+def _kimi_cache_key(full_text: str) -> str:
+    digest = hashlib.blake2b(full_text.encode(), digest_size=16).hexdigest()
+    return f"kimi:{digest}:{KIMI_CACHE_VERSION}"
+
+
+async def iter_transcript_moments(
+    transcript_result: Dict[str, Any],
+    project_id: str,
+    received: Optional[List[Dict[str, Any]]] = None
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Analyze transcript to identify key moments using Kimi.
+    Stream validated moments out of Kimi as it generates them.
     
-    Returns:
-        List of Moment objects
+    Yields Moment column values; nothing touches the database, so the
+    caller can write the whole batch in one INSERT. Raw moment dicts are
+    appended to ``received`` when given.
     """
     full_text = transcript_result["full_text"]
-    segments = transcript_result["segments"]
     
-    # Build improved prompt for Kimi
     prompt = f"""Analyze this testimonial interview transcript and identify 3-5 most valuable moments from the SUBJECT (not the interviewer).
 
 TRANSCRIPT:
@@ -183,130 +491,133 @@ Return ONLY a JSON array:
 
 PRIORITIZE: Specific numbers > emotional praise > general statements > questions"""
 
-    # Call Kimi API
-    try:
-        print("[Analysis] Calling Kimi API for moment analysis...")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.moonshot_base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.moonshot_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "moonshot-v1-8k",
-                    "messages": [
-                        {"role": "system", "content": "You are an expert content analyst specializing in testimonial videos. Your job is to identify the most valuable, quotable moments where the subject provides specific results and emotional reactions."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.2,
-                    "response_format": {"type": "json_object"}
-                },
-                timeout=60.0
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            # Parse the response
-            content = result["choices"][0]["message"]["content"]
-            moments_data = json.loads(content)
-            
-            # Ensure it's a list
-            if isinstance(moments_data, dict) and "moments" in moments_data:
-                moments_data = moments_data["moments"]
-            elif not isinstance(moments_data, list):
-                moments_data = [moments_data]
-            
-            print(f"[Analysis] Kimi returned {len(moments_data)} moments")
-            
-            # Validate and filter moments
-            moments = []
-            for m_data in moments_data:
-                start_time = m_data.get("start_time", 0)
-                end_time = m_data.get("end_time", 0)
-                quotable_text = m_data.get("quotable_text", "")
-                
-                # Skip if it looks like a question
-                if quotable_text.strip().endswith('?'):
-                    print(f"[Analysis] Skipping moment with question: {quotable_text[:50]}...")
-                    continue
-                
-                # Skip if too short
-                if end_time - start_time < 3.0:
-                    print(f"[Analysis] Skipping short moment ({end_time - start_time:.1f}s)")
-                    continue
-                
-                moment = Moment(
-                    project_id=project_id,
-                    moment_type=m_data.get("moment_type", "general"),
-                    start_time=start_time,
-                    end_time=end_time,
-                    transcript=quotable_text,
-                    summary=m_data.get("summary", ""),
-                    sentiment_score=m_data.get("sentiment_score", 0),
-                    importance_score=m_data.get("importance_score", 0.5),
-                    quotable_text=quotable_text,
-                    quotable_score=m_data.get("quotable_score", 0.5)
-                )
-                db.add(moment)
-                moments.append(moment)
-                print(f"[Analysis] Created moment: {quotable_text[:60]}...")
-            
+    print("[Analysis] Calling Kimi API for moment analysis (streaming)...")
+    # The prompt carries the whole transcript; encode it with orjson (raw
+    # UTF-8, no ASCII escaping) instead of httpx's stdlib json=
+    body = orjson.dumps({
+        "model": "moonshot-v1-8k",
+        "messages": [
+            {"role": "system", "content": "You are an expert content analyst specializing in testimonial videos. Your job is to identify the most valuable, quotable moments where the subject provides specific results and emotional reactions."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "response_format": {"type": "json_object"},
+        "stream": True
+    })
+    async with get_kimi_client().stream(
+        "POST",
+        "/chat/completions",
+        content=body,
+        headers={"Content-Type": "application/json"}
+    ) as response:
+        response.raise_for_status()
+        
+        async for m_data in _stream_moment_objects(response):
+            if received is not None:
+                received.append(m_data)
+            row = _moment_row_from_kimi(m_data, project_id)
+            if row is None:
+                continue
+            print(f"[Analysis] Received moment: {row['quotable_text'][:60]}...")
+            yield row
+
+
+async def analyze_transcript(transcript_result: Dict[str, Any], project_id: str, db: Session) -> List[Moment]:
+    """
+    Analyze transcript to identify key moments using Kimi.
+    
+    Returns:
+        List of Moment objects
+    """
+    segments = transcript_result["segments"]
+    
+    # Same transcript analyzed before (re-upload, retry): reuse the result
+    cache_key = _kimi_cache_key(transcript_result["full_text"])
+    cached = await get_cached_json(cache_key)
+    if cached:
+        rows = [r for r in (_moment_row_from_kimi(d, project_id) for d in cached) if r]
+        if len(rows) >= 2:
+            moments = bulk_insert(db, Moment, rows, returning=True)
             db.commit()
-            
-            # If Kimi returned good moments, use them
-            if len(moments) >= 2:
-                print(f"[Analysis] Successfully created {len(moments)} moments from Kimi")
-                return moments
-            else:
-                print(f"[Analysis] Kimi returned insufficient moments ({len(moments)}), using fallback")
-                
+            print(f"[Analysis] Reused cached Kimi analysis ({len(moments)} moments)")
+            return moments
+    
+    rows: List[Dict[str, Any]] = []
+    received: List[Dict[str, Any]] = []
+    completed = False
+    try:
+        async for row in iter_transcript_moments(transcript_result, project_id, received):
+            rows.append(row)
+        completed = True
+        print(f"[Analysis] Kimi returned {len(rows)} usable moments")
     except Exception as e:
         print(f"[Analysis] Error calling Kimi API: {e}")
     
+    # If Kimi returned good moments (even if the stream broke off after
+    # them), write them all in one INSERT ... RETURNING
+    if len(rows) >= 2:
+        moments = bulk_insert(db, Moment, rows, returning=True)
+        db.commit()
+        if completed:
+            print(f"[Analysis] Successfully created {len(moments)} moments from Kimi")
+            await set_cached_json(cache_key, received, KIMI_CACHE_TTL)
+        else:
+            print(f"[Analysis] Keeping {len(moments)} moments received before the error")
+        return moments
+    
+    if completed:
+        print(f"[Analysis] Kimi returned insufficient moments ({len(rows)}), using fallback")
+    
     # Fallback: use heuristic-based segment selection
     print("[Analysis] Using heuristic fallback for moment selection...")
     return await _create_fallback_moments(segments, project_id, db)
 
 
+def _longest_segment_indices(segments: List[Dict], k: int) -> List[int]:
+    """Indices of the k longest segments, longest first (ties keep transcript order)."""
+    return _top_k_indices(_segment_durations(segments), k).tolist()
+
+
 async def _create_fallback_moments(segments: List[Dict], project_id: str, db: Session) -> List[Moment]:
     """Create quality moments using heuristics when AI analysis fails."""
-    moments = []
+    rows = []
     
-    # Identify best segments using quality heuristics
-    best_segments = identify_best_segments(segments, max_segments=3)
+    # Identify best segments using quality heuristics; the scores are kept
+    # for importance weighting rather than recomputed per moment
+    best_indices, quality_scores = _rank_segments(segments, max_segments=3)
     
-    if not best_segments:
+    if not best_indices and segments:
         print("[Analysis] WARNING: No quality segments found! Using top 3 by duration.")
-        # Last resort: use longest segments
-        sorted_segments = sorted(segments, key=lambda s: s.get('end', 0) - s.get('start', 0), reverse=True)
-        best_segments = sorted_segments[:3]
+        # Last resort: use longest segments; durations are computed in one
+        # array pass and only the top 3 are partitioned out
+        best_indices = _longest_segment_indices(segments, 3)
     
     # Create moments from best segments
-    for i, seg in enumerate(best_segments):
+    for i, seg_index in enumerate(best_indices):
+        seg = segments[seg_index]
         text = seg.get('text', '').strip()
         duration = seg.get('end', 0) - seg.get('start', 0)
+        quality_score = quality_scores[seg_index]
         
-        # Calculate quality score for importance weighting
-        quality_score, _ = calculate_segment_quality(seg)
-        
-        moment = Moment(
-            project_id=project_id,
-            moment_type="general",
-            start_time=seg.get('start', 0),
-            end_time=seg.get('end', 0),
-            transcript=text,
-            summary=f"Key insight ({duration:.0f}s): {text[:80]}..." if len(text) > 80 else f"Key insight: {text}",
-            sentiment_score=0.3,
-            importance_score=min(quality_score, 1.0),
-            quotable_text=text,
-            quotable_score=min(quality_score, 1.0)
-        )
-        db.add(moment)
-        moments.append(moment)
+        rows.append({
+            "project_id": project_id,
+            "moment_type": "general",
+            "start_time": seg.get('start', 0),
+            "end_time": seg.get('end', 0),
+            "transcript": text,
+            "summary": f"Key insight ({duration:.0f}s): {text[:80]}..." if len(text) > 80 else f"Key insight: {text}",
+            "sentiment_score": 0.3,
+            "importance_score": min(quality_score, 1.0),
+            "quotable_text": text,
+            "quotable_score": min(quality_score, 1.0)
+        })
         print(f"[Analysis] Created quality moment {i+1} (score {quality_score:.2f}, {duration:.1f}s): {text[:50]}...")
     
+    if not rows:
+        return []
+    
+    # One multi-row INSERT ... RETURNING that hands back ORM objects in order
+    moments = bulk_insert(db, Moment, rows, returning=True)
     db.commit()
     print(f"[Analysis] Fallback created {len(moments)} quality moments")
     return moments
@@ -323,65 +634,71 @@ async def generate_text_assets(moments: List[Moment], transcript_result: Dict[st
         return
     
     # Get top 3 most quotable moments
-    top_moments = sorted(valid_moments, key=lambda m: m.quotable_score or 0, reverse=True)[:3]
+    top_moments = heapq.nlargest(3, valid_moments, key=lambda m: m.quotable_score or 0)
+    
+    # Every text asset goes in as one multi-row INSERT (rows share one key set)
+    asset_rows: List[Dict[str, Any]] = []
     
     # Generate quotable snippets asset
     for i, moment in enumerate(top_moments):
-        asset = Asset(
-            project_id=project_id,
-            moment_id=moment.id,
-            asset_type="quote_card",
-            title=f"Quote {i+1}",
-            content=moment.quotable_text,
-            description=moment.summary,
-            status="completed"
-        )
-        db.add(asset)
+        asset_rows.append({
+            "project_id": project_id,
+            "moment_id": moment.id,
+            "asset_type": "quote_card",
+            "title": f"Quote {i+1}",
+            "content": moment.quotable_text,
+            "description": moment.summary,
+            "status": "completed"
+        })
         print(f"[Analysis] Created quote card {i+1}: {moment.quotable_text[:50]}...")
     
     # Generate email templates
     best_moment = top_moments[0]
-    
-    email_asset = Asset(
-        project_id=project_id,
-        moment_id=best_moment.id,
-        asset_type="email",
-        title="Testimonial Email",
-        content=f"""Subject: The results speak for themselves
+    # Read the instrumented attributes once for every template below
+    quote = best_moment.quotable_text
+    summary = best_moment.summary or ""
+    
+    asset_rows.append({
+        "project_id": project_id,
+        "moment_id": best_moment.id,
+        "asset_type": "email",
+        "title": "Testimonial Email",
+        "description": None,
+        "content": f"""Subject: The results speak for themselves
 
 Hi [First Name],
 
 I wanted to share what one of our clients recently shared:
 
-"{best_moment.quotable_text}"
+"{quote}"
 
-{best_moment.summary}
+{summary}
 
 Ready to see similar results? Let's talk.
 
 Best regards,
 [Your Name]""",
-        status="completed"
-    )
-    db.add(email_asset)
+        "status": "completed"
+    })
     
     # Social media captions - tailored to platform
     social_platforms = [
-        ("twitter", f'"{best_moment.quotable_text[:250]}" - Real client feedback'),
-        ("linkedin", f"Client Spotlight:\n\n\"{best_moment.quotable_text[:180]}...\"\n\n{best_moment.summary[:100]}\n\n#ClientSuccess #Results #Testimonial"),
-        ("instagram", f"\"{best_moment.quotable_text[:120]}...\" 💬\n\nReal results from real clients ✨\n\n#testimonial #clientlove #results #transformation")
+        ("twitter", f'"{quote[:250]}" - Real client feedback'),
+        ("linkedin", f"Client Spotlight:\n\n\"{quote[:180]}...\"\n\n{summary[:100]}\n\n#ClientSuccess #Results #Testimonial"),
+        ("instagram", f"\"{quote[:120]}...\" 💬\n\nReal results from real clients ✨\n\n#testimonial #clientlove #results #transformation")
     ]
     
     for platform, caption in social_platforms:
-        asset = Asset(
-            project_id=project_id,
-            moment_id=best_moment.id,
-            asset_type=f"social_post_{platform}",
-            title=f"{platform.capitalize()} Caption",
-            content=caption,
-            status="completed"
-        )
-        db.add(asset)
-    
+        asset_rows.append({
+            "project_id": project_id,
+            "moment_id": best_moment.id,
+            "asset_type": f"social_post_{platform}",
+            "title": f"{platform.capitalize()} Caption",
+            "description": None,
+            "content": caption,
+            "status": "completed"
+        })
+    
+    bulk_insert(db, Asset, asset_rows)
     db.commit()
     print(f"[Analysis] Generated text assets from {len(top_moments)} moments")
@@ -1,6 +1,9 @@
 """Storage service for Google Drive integration."""
 
+import asyncio
 import os
+import threading
+from functools import lru_cache
 from typing import Optional
 from sqlalchemy.orm import Session
 
@@ -13,14 +16,56 @@ from app.models import Asset
 
 settings = get_settings()
 
+# Max in-flight Drive uploads per project (Drive per-user rate limits)
+DRIVE_UPLOAD_CONCURRENCY = 8
 
-def get_drive_service():
-    """Get Google Drive service instance."""
-    creds = service_account.Credentials.from_service_account_file(
+
+@lru_cache(maxsize=1)
+def _drive_credentials():
+    # Read from disk once per process; google-auth refreshes tokens in place
+    return service_account.Credentials.from_service_account_file(
         settings.google_credentials_path,
         scopes=['https://www.googleapis.com/auth/drive']
     )
-    return build('drive', 'v3', credentials=creds)
+
+
+_thread_local = threading.local()
+
+
+def get_drive_service():
+    """
+    Get the Google Drive service instance for the current thread.
+    
+    Drive calls run in worker threads and the underlying httplib2
+    connection is not thread-safe, so each thread builds its own service
+    once and reuses it; credentials are shared.
+    """
+    service = getattr(_thread_local, "drive_service", None)
+    if service is None:
+        # Drive v3's discovery document ships with the client library, so
+        # there is nothing to fetch or cache
+        service = build(
+            'drive', 'v3',
+            credentials=_drive_credentials(),
+            static_discovery=True,
+            cache_discovery=False
+        )
+        _thread_local.drive_service = service
+    return service
+
+
+def _upload_file(file_path: str, file_metadata: dict) -> dict:
+    media = MediaFileUpload(file_path, resumable=True)
+    return get_drive_service().files().create(
+        body=file_metadata,
+        media_body=media,
+        supportsAllDrives=True,
+        fields='id, name, webViewLink'
+    ).execute()
+
+
+def _create_file(metadata: dict) -> dict:
+    return get_drive_service().files().create(body=metadata, fields='id').execute()
 
 
 async def upload_to_drive(
@@ -34,8 +79,6 @@ async def upload_to_drive(
     Returns:
         Google Drive file URL
     """
-    service = get_drive_service()
-    
     file_metadata = {
         'name': filename,
     }
@@ -43,22 +86,14 @@ async def upload_to_drive(
     if folder_id:
         file_metadata['parents'] = [folder_id]
     
-    media = MediaFileUpload(file_path, resumable=True)
-    
-    file = service.files().create(
-        body=file_metadata,
-        media_body=media,
-        supportsAllDrives=True,
-        fields='id, name, webViewLink'
-    ).execute()
+    # googleapiclient is blocking; upload from a worker thread
+    file = await asyncio.to_thread(_upload_file, file_path, file_metadata)
     
     return file.get('webViewLink', '')
 
 
 async def create_folder(name: str, parent_id: Optional[str] = None) -> str:
     """Create a folder in Google Drive."""
-    service = get_drive_service()
-    
     metadata = {
         'name': name,
         'mimeType': 'application/vnd.google-apps.folder'
@@ -67,7 +102,7 @@ async def create_folder(name: str, parent_id: Optional[str] = None) -> str:
     if parent_id:
         metadata['parents'] = [parent_id]
     
-    folder = service.files().create(body=metadata, fields='id').execute()
+    folder = await asyncio.to_thread(_create_file, metadata)
     return folder['id']
 
 
@@ -83,21 +118,30 @@ async def upload_project_assets(project_id: str, db: Session):
     folder_name = f"Fission-{project_id[:8]}"
     folder_id = await create_folder(folder_name)
     
-    # Upload each asset
-    for asset in project.assets:
-        if asset.file_path and os.path.exists(asset.file_path):
+    # Upload assets concurrently, bounded by the semaphore
+    semaphore = asyncio.Semaphore(DRIVE_UPLOAD_CONCURRENCY)
+    
+    async def upload(asset: Asset):
+        async with semaphore:
             try:
-                file_url = await upload_to_drive(
+                # Clips are .mp4, saved visuals .png; keep the file's own type
+                extension = os.path.splitext(asset.file_path)[1] or ".mp4"
+                asset.file_url = await upload_to_drive(
                     asset.file_path,
-                    f"{asset.asset_type}_{asset.id[:8]}.mp4",
+                    f"{asset.asset_type}_{str(asset.id)[:8]}{extension}",
                     folder_id
                 )
-                asset.file_url = file_url
                 asset.status = "completed"
-                db.commit()
             except Exception as e:
                 print(f"Error uploading asset {asset.id}: {e}")
                 asset.status = "failed"
-                db.commit()
+    
+    await asyncio.gather(*(
+        upload(asset) for asset in project.assets
+        if asset.file_path and os.path.exists(asset.file_path)
+    ))
+    
+    # One commit for every asset's new status
+    db.commit()
     
     return folder_id
@@ -3,10 +3,19 @@ Story Arc Detection Service
 Identifies narrative structures in transcripts and builds logical story sequences.
 """
 
-from typing import Dict, Any, List, Tuple
+import hashlib
+import heapq
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+import ahocorasick
+import numpy as np
+import orjson
+
 class StoryBeatType(Enum):
     HOOK = "hook"                    # Attention grabber
     PROBLEM = "problem"              # Pain point
@@ -18,7 +27,7 @@ class StoryBeatType(Enum):
     CTA = "cta"                      # Call to action
     CONTEXT = "context"              # Background/setup
 
-@dataclass
+@dataclass(slots=True)
 class StoryBeat:
     beat_type: StoryBeatType
     start_time: float
@@ -73,183 +82,187 @@ class StoryArcDetector:
     def __init__(self):
         self.beat_scores = {}
     
-    def classify_segment(self, segment: Dict) -> List[Tuple[StoryBeatType, float]]:
+    def _match_beats(self, text: str) -> List[Tuple[StoryBeatType, float, List[str]]]:
         """
-        Classify a transcript segment into story beat types.
-        Returns list of (beat_type, confidence_score) tuples.
+        Score every beat type against lowercased text.
+        Returns (beat_type, score, matched_keywords), best first.
         """
-        text = segment.get('text', '').lower()
-        scores = []
+        # One automaton pass finds every keyword; each hit sets its bit in
+        # every beat it belongs to (e.g. "used to" is both PROBLEM and
+        # TRANSFORMATION), so repeats cost nothing and no lists are built
+        masks = [0] * len(_BEAT_TYPES)
+        for _, (_, slots) in _KEYWORD_AUTOMATON.iter(text):
+            for beat_index, bit in slots:
+                masks[beat_index] |= bit
         
-        for beat_type, keywords in self.BEAT_KEYWORDS.items():
-            score = 0.0
-            matched_keywords = []
-            
-            for keyword in keywords:
-                if keyword in text:
-                    score += 0.2
-                    matched_keywords.append(keyword)
-            
-            # Bonus for multiple keyword matches
-            if len(matched_keywords) >= 2:
-                score += 0.3
-            
-            # Normalize to 0-1 range
-            score = min(score, 1.0)
-            
+        scores = []
+        for beat_index, mask in enumerate(masks):
+            score = _MATCH_SCORES[mask.bit_count()]
             if score > 0.2:  # Only include if reasonably confident
-                scores.append((beat_type, score, matched_keywords))
+                keywords = _BEAT_KEYWORD_LISTS[beat_index]
+                scores.append((
+                    _BEAT_TYPES[beat_index],
+                    score,
+                    [keywords[p] for p in range(len(keywords)) if mask >> p & 1]
+                ))
         
         # Sort by score descending
         scores.sort(key=lambda x: x[1], reverse=True)
-        
-        return [(beat_type, score) for beat_type, score, _ in scores]
+        return scores
+    
+    def classify_segment(self, segment: Dict) -> List[Tuple[StoryBeatType, float, List[str]]]:
+        """
+        Classify a transcript segment into story beat types.
+        Returns list of (beat_type, confidence_score, matched_keywords) tuples.
+        """
+        return self._match_beats(segment.get('text', '').lower())
     
     def detect_story_beats(self, segments: List[Dict]) -> List[StoryBeat]:
         """
         Detect all story beats in transcript segments.
         """
-        beats = []
+        if not segments:
+            return []
         
-        for segment in segments:
-            classifications = self.classify_segment(segment)
-            
-            if classifications:
-                # Take the highest confidence beat type
-                best_type, best_score = classifications[0]
-                
-                beat = StoryBeat(
-                    beat_type=best_type,
-                    start_time=segment.get('start', 0),
-                    end_time=segment.get('end', 0),
-                    text=segment.get('text', ''),
-                    importance=best_score,
-                    keywords=[kw for _, _, kws in classifications for kw in kws]
-                )
-                beats.append(beat)
+        # Scan every segment in one automaton pass over the joined text; no
+        # keyword contains the separator, so no hit straddles two segments
+        texts = [segment.get('text', '').lower() for segment in segments]
+        offsets = np.cumsum([0] + [len(t) + 1 for t in texts[:-1]])
+        ends, keyword_ids = [], []
+        for end, (keyword_id, _) in _KEYWORD_AUTOMATON.iter(_SEGMENT_SEPARATOR.join(texts)):
+            ends.append(end)
+            keyword_ids.append(keyword_id)
+        
+        # (segment, distinct keyword) hits -> per-beat match counts -> scores
+        hits = np.zeros((len(segments), len(_KEYWORD_SLOTS)), dtype=bool)
+        if ends:
+            hits[np.searchsorted(offsets, ends, side='right') - 1, keyword_ids] = True
+        scores = _MATCH_SCORE_ARRAY[hits.astype(np.intp) @ _KEYWORD_BEAT_COUNTS]
+        
+        # Highest confidence beat type; argmax keeps the first of equal
+        # scores, as the stable sort in classify_segment does
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(segments)), best]
+        
+        beats = []
+        for i in np.flatnonzero(best_scores > 0.2):  # Only if reasonably confident
+            beat_index = best[i]
+            segment = segments[i]
+            segment_hits = hits[i]
+            beat = StoryBeat(
+                beat_type=_BEAT_TYPES[beat_index],
+                start_time=segment.get('start', 0),
+                end_time=segment.get('end', 0),
+                text=segment.get('text', ''),
+                importance=float(best_scores[i]),
+                keywords=[
+                    _KEYWORD_SLOTS[k][0]
+                    for k in _BEAT_KEYWORD_IDS[beat_index] if segment_hits[k]
+                ]
+            )
+            beats.append(beat)
         
         # Sort by time
         beats.sort(key=lambda b: b.start_time)
         
         return beats
     
+    # Arc patterns, in priority order: earlier patterns claim beats first.
+    # Each is (arc type, anchor beat, follow-up steps, duration range, score
+    # bonus, bonus per beat); a step is (allowed beat types, window) and
+    # searches the beats after the previous match, stopping the arc at the
+    # first step that finds nothing.
+    ARC_PATTERNS = (
+        # Problem → Solution → Proof (classic testimonial); Solution within
+        # ~60 seconds, then Proof/Result after it
+        ('problem_solution', StoryBeatType.PROBLEM, (
+            (frozenset({StoryBeatType.SOLUTION}), 10),
+            (frozenset({StoryBeatType.PROOF, StoryBeatType.EMOTION}), 5),
+        ), (10, 90), 0.0, 0.1),
+        # Hook → Proof/Emotion (attention grabbers)
+        ('hook_proof', StoryBeatType.HOOK, (
+            (frozenset({StoryBeatType.PROOF, StoryBeatType.EMOTION, StoryBeatType.SOLUTION}), 6),
+        ), (5, 45), 0.0, 0.0),
+        # Transformation (Before → After → Emotion)
+        ('transformation', StoryBeatType.TRANSFORMATION, (
+            (frozenset({StoryBeatType.PROOF, StoryBeatType.EMOTION}), 6),
+        ), (5, 60), 0.15, 0.0),
+        # Emotional journey (Emotion → Proof → CTA)
+        ('emotional_journey', StoryBeatType.EMOTION, (
+            (frozenset({StoryBeatType.PROOF, StoryBeatType.CTA}), 6),
+        ), (5, 45), 0.0, 0.0),
+    )
+    
+    def _build_arc(
+        self,
+        beats: List[StoryBeat],
+        used: bytearray,
+        i: int,
+        pattern: Tuple,
+        step_positions: Tuple[List[int], ...]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Grow one arc from the anchor at beats[i] following pattern.
+        
+        step_positions holds, per step, the sorted positions of the beats
+        whose type that step allows. Every beat the arc picks up (the anchor
+        included) is marked in used even when the arc is rejected; returns
+        the arc, or None if it is too short or outside the pattern's
+        duration range.
+        """
+        arc_type, _, steps, (min_duration, max_duration), bonus, beat_bonus = pattern
+        arc_beats = [beats[i]]
+        importance_sum = beats[i].importance
+        used[i] = 1
+        
+        last = i
+        for (_, window), positions in zip(steps, step_positions):
+            # First allowed, unused beat in (last, last + window)
+            hi = min(last + window, len(beats))
+            k = bisect_right(positions, last)
+            while k < len(positions) and positions[k] < hi and used[positions[k]]:
+                k += 1
+            if k == len(positions) or positions[k] >= hi:
+                break
+            last = positions[k]
+            arc_beats.append(beats[last])
+            importance_sum += beats[last].importance
+            used[last] = 1
+        
+        if len(arc_beats) < 2:
+            return None
+        duration = arc_beats[-1].end_time - arc_beats[0].start_time
+        if not min_duration <= duration <= max_duration:
+            return None
+        return {
+            'type': arc_type,
+            'beats': arc_beats,
+            'duration': duration,
+            'score': (
+                importance_sum / len(arc_beats)
+                + bonus + len(arc_beats) * beat_bonus
+            )
+        }
+    
     def build_story_arcs(self, beats: List[StoryBeat]) -> List[Dict[str, Any]]:
         """
         Build complete story arcs from detected beats.
         Returns list of story structures with multiple beats.
         """
         arcs = []
-        used_beats = set()  # Track which beats have been used in arcs
-        
-        # Look for Problem → Solution → Proof patterns (classic testimonial)
-        for i, beat in enumerate(beats):
-            if beat.beat_type == StoryBeatType.PROBLEM and i not in used_beats:
-                arc_beats = [beat]
-                used_beats.add(i)
-                
-                # Look for Solution within next 60 seconds
-                for j in range(i + 1, min(i + 10, len(beats))):
-                    if j in used_beats:
-                        continue
-                    next_beat = beats[j]
-                    if next_beat.beat_type == StoryBeatType.SOLUTION:
-                        arc_beats.append(next_beat)
-                        used_beats.add(j)
-                        # Look for Proof/Result after Solution
-                        for k in range(j + 1, min(j + 5, len(beats))):
-                            if k in used_beats:
-                                continue
-                            proof_beat = beats[k]
-                            if proof_beat.beat_type in [StoryBeatType.PROOF, StoryBeatType.EMOTION]:
-                                arc_beats.append(proof_beat)
-                                used_beats.add(k)
-                                break
-                        break
-                
-                if len(arc_beats) >= 2:
-                    duration = arc_beats[-1].end_time - arc_beats[0].start_time
-                    if 10 <= duration <= 90:  # Reasonable story length
-                        arcs.append({
-                            'type': 'problem_solution',
-                            'beats': arc_beats,
-                            'duration': duration,
-                            'score': sum(b.importance for b in arc_beats) / len(arc_beats) + len(arc_beats) * 0.1
-                        })
+        types = np.array([_BEAT_IDS[beat.beat_type] for beat in beats], dtype=np.intp)
+        used = bytearray(len(beats))  # Beats already claimed by an arc
         
-        # Look for Hook → Proof/Emotion patterns (attention grabbers)
-        for i, beat in enumerate(beats):
-            if beat.beat_type == StoryBeatType.HOOK and i not in used_beats:
-                arc_beats = [beat]
-                used_beats.add(i)
-                
-                for j in range(i + 1, min(i + 6, len(beats))):
-                    if j in used_beats:
-                        continue
-                    next_beat = beats[j]
-                    if next_beat.beat_type in [StoryBeatType.PROOF, StoryBeatType.EMOTION, StoryBeatType.SOLUTION]:
-                        arc_beats.append(next_beat)
-                        used_beats.add(j)
-                        break
-                
-                if len(arc_beats) >= 2:
-                    duration = arc_beats[-1].end_time - arc_beats[0].start_time
-                    if 5 <= duration <= 45:
-                        arcs.append({
-                            'type': 'hook_proof',
-                            'beats': arc_beats,
-                            'duration': duration,
-                            'score': sum(b.importance for b in arc_beats) / len(arc_beats)
-                        })
-        
-        # Look for Transformation arcs (Before → After → Emotion)
-        for i, beat in enumerate(beats):
-            if beat.beat_type == StoryBeatType.TRANSFORMATION and i not in used_beats:
-                arc_beats = [beat]
-                used_beats.add(i)
-                
-                for j in range(i + 1, min(i + 6, len(beats))):
-                    if j in used_beats:
-                        continue
-                    next_beat = beats[j]
-                    if next_beat.beat_type in [StoryBeatType.PROOF, StoryBeatType.EMOTION]:
-                        arc_beats.append(next_beat)
-                        used_beats.add(j)
-                        break
-                
-                if len(arc_beats) >= 2:
-                    duration = arc_beats[-1].end_time - arc_beats[0].start_time
-                    if 5 <= duration <= 60:
-                        arcs.append({
-                            'type': 'transformation',
-                            'beats': arc_beats,
-                            'duration': duration,
-                            'score': sum(b.importance for b in arc_beats) / len(arc_beats) + 0.15
-                        })
-        
-        # Build emotional journey arcs (Emotion → Proof → CTA)
-        for i, beat in enumerate(beats):
-            if beat.beat_type == StoryBeatType.EMOTION and i not in used_beats:
-                arc_beats = [beat]
-                used_beats.add(i)
-                
-                for j in range(i + 1, min(i + 6, len(beats))):
-                    if j in used_beats:
-                        continue
-                    next_beat = beats[j]
-                    if next_beat.beat_type in [StoryBeatType.PROOF, StoryBeatType.CTA]:
-                        arc_beats.append(next_beat)
-                        used_beats.add(j)
-                        break
-                
-                if len(arc_beats) >= 2:
-                    duration = arc_beats[-1].end_time - arc_beats[0].start_time
-                    if 5 <= duration <= 45:
-                        arcs.append({
-                            'type': 'emotional_journey',
-                            'beats': arc_beats,
-                            'duration': duration,
-                            'score': sum(b.importance for b in arc_beats) / len(arc_beats)
-                        })
+        for pattern, step_masks in zip(self.ARC_PATTERNS, _ARC_STEP_MASKS):
+            # Candidate positions are found once per pattern; each pattern
+            # visits only its own anchors
+            step_positions = tuple(np.flatnonzero(allowed[types]).tolist() for allowed in step_masks)
+            for i in np.flatnonzero(types == _BEAT_IDS[pattern[1]]).tolist():
+                if used[i]:
+                    continue
+                arc = self._build_arc(beats, used, i, pattern, step_positions)
+                if arc:
+                    arcs.append(arc)
         
         # Sort by score (highest quality first)
         arcs.sort(key=lambda a: a['score'], reverse=True)
@@ -321,10 +334,8 @@ class StoryArcDetector:
                     'narrative_flow': 'individual'
                 })
         
-        # Sort by duration (shortest first for easier browsing)
-        suggestions.sort(key=lambda x: x['duration'])
-        
-        return suggestions[:6]  # Return top 6 suggestions
+        # Top 6 suggestions, shortest first for easier browsing
+        return heapq.nsmallest(6, suggestions, key=lambda x: x['duration'])
     
     def _get_purpose_for_duration(self, duration: float) -> str:
         """Get recommended platform based on duration."""
@@ -338,12 +349,109 @@ class StoryArcDetector:
             return "Full Story - Website, Email, Presentations"
 
 
+def _build_keyword_slots(
+    beat_keywords: Dict[StoryBeatType, List[str]]
+) -> Tuple[Tuple[StoryBeatType, ...], Tuple[Tuple[str, Tuple[Tuple[int, int], ...]], ...]]:
+    """
+    Flatten BEAT_KEYWORDS into a table of distinct keywords.
+    
+    Each keyword maps to the (beat index, 1 << position in that beat's list)
+    slots it fills, so one hit is credited to all of its beats as a bit.
+    """
+    beat_types = tuple(beat_keywords)
+    slots: Dict[str, List[Tuple[int, int]]] = {}
+    for beat_index, beat_type in enumerate(beat_types):
+        for position, keyword in enumerate(beat_keywords[beat_type]):
+            slots.setdefault(keyword, []).append((beat_index, 1 << position))
+    return beat_types, tuple((keyword, tuple(s)) for keyword, s in slots.items())
+
+
+def _build_match_scores(max_matches: int) -> Tuple[float, ...]:
+    """Beat confidence by number of keyword matches: 0.2 each, +0.3 for 2+, capped at 1."""
+    scores = []
+    for matches in range(max_matches + 1):
+        score = 0.0
+        for _ in range(matches):
+            score += 0.2
+        if matches >= 2:
+            score += 0.3
+        scores.append(min(score, 1.0))
+    return tuple(scores)
+
+
+def _build_keyword_automaton(keyword_slots) -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton()
+    for keyword_id, (keyword, slots) in enumerate(keyword_slots):
+        automaton.add_word(keyword, (keyword_id, slots))
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_beat_matrix(keyword_slots, beat_count: int) -> Tuple[np.ndarray, Tuple[Tuple[int, ...], ...]]:
+    """
+    Keyword id -> beat match-count matrix for detect_story_beats, plus each
+    beat's keyword ids in BEAT_KEYWORDS order.
+    """
+    counts = np.zeros((len(keyword_slots), beat_count), dtype=np.intp)
+    ordered: List[List[Tuple[int, int]]] = [[] for _ in range(beat_count)]
+    for keyword_id, (_, slots) in enumerate(keyword_slots):
+        for beat_index, bit in slots:
+            counts[keyword_id, beat_index] += 1
+            ordered[beat_index].append((bit, keyword_id))
+    return counts, tuple(tuple(k for _, k in sorted(ids)) for ids in ordered)
+
+
+_BEAT_TYPES, _KEYWORD_SLOTS = _build_keyword_slots(StoryArcDetector.BEAT_KEYWORDS)
+_BEAT_KEYWORD_LISTS = tuple(tuple(StoryArcDetector.BEAT_KEYWORDS[bt]) for bt in _BEAT_TYPES)
+_KEYWORD_AUTOMATON = _build_keyword_automaton(_KEYWORD_SLOTS)
+_MATCH_SCORES = _build_match_scores(max(len(kws) for kws in StoryArcDetector.BEAT_KEYWORDS.values()))
+_MATCH_SCORE_ARRAY = np.array(_MATCH_SCORES)
+_KEYWORD_BEAT_COUNTS, _BEAT_KEYWORD_IDS = _build_beat_matrix(_KEYWORD_SLOTS, len(_BEAT_TYPES))
+_SEGMENT_SEPARATOR = '\x1f'  # For detect_story_beats; in no keyword
+
+# analyze_story_structure results by segments hash, least recently used first
+STORY_CACHE_SIZE = 64
+_story_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+_story_cache_lock = threading.Lock()
+_BEAT_IDS = {beat_type: index for index, beat_type in enumerate(_BEAT_TYPES)}
+_ARC_STEP_MASKS = tuple(
+    tuple(
+        np.array([beat_type in allowed for beat_type in _BEAT_TYPES])
+        for allowed, _ in pattern[2]
+    )
+    for pattern in StoryArcDetector.ARC_PATTERNS
+)
+
+
 def analyze_story_structure(transcript_result: Dict[str, Any]) -> Dict[str, Any]:
     """
     Main entry point: analyze transcript and return story structure.
+    
+    The result depends only on the segments, so it is memoized per process
+    keyed by a hash of them; callers must treat it as read-only.
     """
-    detector = StoryArcDetector()
     segments = transcript_result.get('segments', [])
+    try:
+        key = hashlib.blake2b(orjson.dumps(segments), digest_size=16).digest()
+    except TypeError:  # orjson.JSONEncodeError; not plain JSON, don't cache
+        return _analyze_segments(segments)
+    
+    with _story_cache_lock:
+        cached = _story_cache.get(key)
+        if cached is not None:
+            _story_cache.move_to_end(key)
+            return cached
+    
+    result = _analyze_segments(segments)
+    with _story_cache_lock:
+        _story_cache[key] = result
+        if len(_story_cache) > STORY_CACHE_SIZE:
+            _story_cache.popitem(last=False)
+    return result
+
+
+def _analyze_segments(segments: List[Dict]) -> Dict[str, Any]:
+    detector = StoryArcDetector()
     
     # Detect beats
     beats = detector.detect_story_beats(segments)
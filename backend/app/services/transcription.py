@@ -1,109 +1,215 @@
 """Transcription service using self-hosted Whisper."""
 
-import os
+import asyncio
 import shutil
-from typing import Dict, Any
+import threading
+import uuid
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+import ctranslate2
+import numpy as np
 from faster_whisper import WhisperModel
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.models import Transcript
+from app.models import Transcript, bulk_insert
 
 settings = get_settings()
 FFMPEG_PATH = shutil.which("ffmpeg") or "ffmpeg"
 
-# Initialize model (will download on first run if not present)
-_model = None
+SAMPLE_RATE = 16000  # Whisper's native rate
+SILENCE_THRESHOLD = 0.01  # Peak below -40 dBFS counts as silence
+SILENCE_PADDING_SECONDS = 0.3  # Kept either side of the speech
 
-def get_model():
-    """Get or initialize Whisper model."""
-    global _model
-    if _model is None:
-        print(f"Loading Whisper model: {settings.whisper_model}")
-        _model = WhisperModel(
+# Concurrent first calls would each load the weights; only one may build it
+_model_lock = threading.Lock()
+
+
+def _whisper_device() -> Tuple[str, str]:
+    """(device, compute_type) from settings; "auto" picks CUDA when present."""
+    device = settings.whisper_device
+    if device == "auto":
+        device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    compute_type = settings.whisper_compute_type
+    if compute_type == "auto":
+        compute_type = "float16" if device == "cuda" else "int8"
+    return device, compute_type
+
+
+@lru_cache(maxsize=1)
+def _load_model() -> WhisperModel:
+    # Downloads the weights on first run if not present
+    device, compute_type = _whisper_device()
+    print(f"Loading Whisper model: {settings.whisper_model} ({device}, {compute_type})")
+    try:
+        return WhisperModel(
+            settings.whisper_model,
+            device=device,
+            compute_type=compute_type
+        )
+    except (RuntimeError, ValueError) as e:
+        if device == "cpu":
+            raise
+        # e.g. CUDA visible but cuDNN/cuBLAS missing from the image
+        print(f"Whisper failed to load on {device} ({e}), falling back to CPU int8")
+        return WhisperModel(
             settings.whisper_model,
             device="cpu",
             compute_type="int8"
         )
-    return _model
 
 
-async def transcribe_video(video_path: str, project_id: str, db: Session) -> Dict[str, Any]:
+def get_model() -> WhisperModel:
+    """Get or initialize Whisper model."""
+    with _model_lock:
+        return _load_model()
+
+
+def preload_model():
+    """Load the model ahead of the first transcription (startup warm-up)."""
+    try:
+        get_model()
+    except Exception as e:
+        print(f"Whisper preload failed, will retry on first use: {e}")
+
+
+async def extract_audio(video_path: str) -> np.ndarray:
     """
-    Transcribe a video file using Whisper.
+    Decode a video's audio track to 16 kHz mono int16 samples.
     
-    Returns:
-        Dict with full_text, segments, language
+    FFmpeg writes raw PCM to stdout, so the audio never round-trips
+    through a temp WAV file; the process is awaited, not run in a thread.
     """
-    model = get_model()
-    
-    # Extract audio first (Whisper works better with audio files)
-    import os
-    base_path = os.path.splitext(video_path)[0]
-    audio_path = f"{base_path}_audio.wav"
-    
-    # Use ffmpeg to extract audio
-    import subprocess
-
-    print(f"[Transcription] Extracting audio from: {video_path}")
-    print(f"[Transcription] Using FFmpeg: {FFMPEG_PATH}")
-
     cmd = [
         FFMPEG_PATH,
+        '-hide_banner', '-nostats', '-loglevel', 'error', '-nostdin',
         '-i', video_path,
         '-vn',  # No video
-        '-acodec', 'pcm_s16le',  # PCM 16-bit
-        '-ar', '16000',  # 16kHz (Whisper's preferred sample rate)
+        '-f', 's16le',  # Raw PCM 16-bit
+        '-acodec', 'pcm_s16le',
+        '-ar', str(SAMPLE_RATE),  # 16kHz (Whisper's preferred sample rate)
         '-ac', '1',  # Mono
-        '-y',  # Overwrite
-        audio_path
+        'pipe:1'
     ]
+    
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    pcm, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        stderr = stderr.decode(errors='replace')
+        print(f"[Transcription] FFmpeg error: {stderr[:1000]}")
+        raise Exception(f"FFmpeg audio extraction failed: {stderr[:500]}")
+    
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def _first_loud_sample(audio: np.ndarray, reverse: bool = False) -> Optional[int]:
+    # Index of the first (or with reverse, last) sample above the threshold.
+    # Scans a second at a time from that end, so only the edges are read
+    n = len(audio)
+    for lo in range(0, n, SAMPLE_RATE):
+        if reverse:
+            start = max(n - lo - SAMPLE_RATE, 0)
+            loud = np.flatnonzero(np.abs(audio[start:n - lo]) > SILENCE_THRESHOLD)
+            if loud.size:
+                return start + int(loud[-1])
+        else:
+            loud = np.flatnonzero(np.abs(audio[lo:lo + SAMPLE_RATE]) > SILENCE_THRESHOLD)
+            if loud.size:
+                return lo + int(loud[0])
+    return None
+
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[Transcription] FFmpeg error: {result.stderr[:1000]}")
-        raise Exception(f"FFmpeg audio extraction failed: {result.stderr[:500]}")
+def trim_silence(audio: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Drop leading and trailing silence from 16 kHz samples.
     
-    try:
-        # Transcribe
-        segments, info = model.transcribe(audio_path, beam_size=5)
-        
-        # Convert to list and build full text
-        segment_list = []
-        full_text_parts = []
-        
-        for segment in segments:
-            seg_dict = {
-                "start": segment.start,
-                "end": segment.end,
-                "text": segment.text.strip()
-            }
-            segment_list.append(seg_dict)
-            full_text_parts.append(segment.text.strip())
-        
-        full_text = " ".join(full_text_parts)
-        
-        # Save to database
-        transcript = Transcript(
-            project_id=project_id,
-            full_text=full_text,
-            language=info.language,
-            segments=segment_list
-        )
-        db.add(transcript)
-        db.commit()
-        
-        result = {
-            "transcript_id": str(transcript.id),
+    Returns the trimmed samples (a view) and the offset in seconds of its
+    first sample, to shift timestamps back onto the original timeline.
+    Audio with no sample above the threshold is returned as is.
+    """
+    first = _first_loud_sample(audio)
+    if first is None:
+        return audio, 0.0
+    last = _first_loud_sample(audio, reverse=True)
+    padding = int(SILENCE_PADDING_SECONDS * SAMPLE_RATE)
+    start = max(first - padding, 0)
+    return audio[start:last + 1 + padding], start / SAMPLE_RATE
+
+
+def _transcribe(model: WhisperModel, pcm: np.ndarray) -> Tuple[List[Dict[str, Any]], Any]:
+    """Decode int16 PCM to plain segment dicts; returns (segments, info)."""
+    audio = pcm.astype(np.float32)
+    audio /= 32768.0
+    
+    # Testimonials often open and close on silence; skip Whisper entirely
+    # there and shift timestamps back to the video's timeline
+    audio, offset = trim_silence(audio)
+    
+    # VAD skips silence before decoding; not conditioning on the previous
+    # window avoids the repetition loops that force slow temperature fallbacks
+    segments, info = model.transcribe(
+        audio,
+        beam_size=settings.whisper_beam_size,
+        vad_filter=settings.whisper_vad_filter,
+        vad_parameters={"min_silence_duration_ms": 500},
+        condition_on_previous_text=False
+    )
+    
+    # The generator decodes lazily as it is consumed
+    segment_list = []
+    for segment in segments:
+        segment_list.append({
+            "start": round(segment.start + offset, 3),
+            "end": round(segment.end + offset, 3),
+            "text": segment.text.strip()
+        })
+    return segment_list, info
+
+
+async def transcribe_video(video_path: str, project_id: str, db: Session) -> Dict[str, Any]:
+    """
+    Transcribe a video file using Whisper.
+    
+    Returns:
+        Dict with full_text, segments, language
+    """
+    # Blocks for the load on a cold start; keep that off the event loop
+    model = await asyncio.to_thread(get_model)
+    
+    print(f"[Transcription] Extracting audio from: {video_path}")
+    print(f"[Transcription] Using FFmpeg: {FFMPEG_PATH}")
+    pcm = await extract_audio(video_path)
+    
+    # Transcribe straight from the in-memory samples, off the event loop
+    segment_list, info = await asyncio.to_thread(_transcribe, model, pcm)
+    full_text = " ".join(seg["text"] for seg in segment_list)
+    
+    # Save to database: one plain INSERT (segments encoded by orjson), no
+    # ORM object to track
+    transcript_id = uuid.uuid4()
+    
+    def save_transcript():
+        bulk_insert(db, Transcript, [{
+            "id": transcript_id,
+            "project_id": project_id,
             "full_text": full_text,
             "language": info.language,
             "segments": segment_list,
-            "duration": segment_list[-1]["end"] if segment_list else 0
-        }
-        
-        return result
-        
-    finally:
-        # Clean up audio file
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
+        }])
+        db.commit()
+    
+    await asyncio.to_thread(save_transcript)
+    
+    result = {
+        "transcript_id": str(transcript_id),
+        "full_text": full_text,
+        "language": info.language,
+        "segments": segment_list,
+        "duration": segment_list[-1]["end"] if segment_list else 0
+    }
+    
+    return result
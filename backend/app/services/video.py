@@ -1,100 +1,399 @@
 """Video processing service using FFmpeg."""
 
+import asyncio
+import heapq
+import logging
 import os
 import shutil
 import subprocess
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import orjson
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.models import Asset, Moment
+from app.models import Asset, Moment, bulk_insert
 
 settings = get_settings()
+log = logging.getLogger(__name__)
 
 # Get ffmpeg path - prefer system ffmpeg, fallback to bundled
 FFMPEG_PATH = shutil.which("ffmpeg") or "ffmpeg"
 FFPROBE_PATH = shutil.which("ffprobe") or "ffprobe"
 
+# Without these FFmpeg streams a banner and per-frame progress to stderr,
+# all of which capture_output buffers; errors alone are enough for the logs
+FFMPEG_QUIET = ['-hide_banner', '-nostats', '-loglevel', 'error', '-nostdin']
+
+# Input option for commands that decode video: use NVDEC/VA-API/etc. when
+# the host has one, plain software decoding otherwise
+FFMPEG_HWACCEL = ['-hwaccel', 'auto']
+
+# Output option for the normalized copy: a keyframe every 2 seconds, so a
+# clip's input-side seek never decodes more than that ahead of its start
+# (encoder defaults can leave 10 s between keyframes)
+NORMALIZED_KEYFRAMES = ['-force_key_frames', 'expr:gte(t,n_forced*2)']
+
+# The normalized copy's longer side is capped at 1080p's: clips come out at
+# 480p or 720x1280, so decoding 4K for every one of them is wasted work.
+# Smaller inputs are left as they are
+MAX_NORMALIZED_SIZE = 1920
+NORMALIZED_SCALE = (
+    f"scale='if(gte(iw,ih),min({MAX_NORMALIZED_SIZE},iw),-2)'"
+    f":'if(gte(iw,ih),-2,min({MAX_NORMALIZED_SIZE},ih))'"
+)
+
+# ultrafast already drops B-frames, lookahead and extra references; zerolatency
+# also stops frame threads buffering frames ahead (sliced threads instead).
+# X264_LOW_MEMORY=false trades that back for frame threading's compression
+X264_LOW_MEMORY = ['-tune', 'zerolatency'] if settings.x264_low_memory else []
+
+# Stderr kept per FFmpeg run for error logs; the rest is read and dropped
+STDERR_TAIL_BYTES = 4096
+
+# Background FFmpeg runs yield the CPU to the API process serving requests
+NICE_PATH = shutil.which("nice")
+FFMPEG_NICE = [NICE_PATH, '-n', '10'] if NICE_PATH else []
+
+# Encodes wait (polling) for FFMPEG_MIN_FREE_MB of free memory, up to a limit
+MEMORY_POLL_SECONDS = 0.25
+MEMORY_WAIT_TIMEOUT = 60
+
+# Tried in order when VIDEO_ENCODER is "auto"; libx264 if none works
+HARDWARE_ENCODERS = ('h264_nvenc', 'h264_qsv', 'h264_vaapi')
+
+
+def encoder_global_args(encoder: str) -> List[str]:
+    """Options that must come before the inputs for encoder."""
+    if encoder == 'h264_vaapi':
+        return ['-vaapi_device', settings.vaapi_device]
+    return []
+
+
+def h264_encode_args(
+    encoder: str,
+    quality: int,
+    vf: Optional[str] = None,
+    single_thread: bool = False,
+    scale: Optional[str] = None
+) -> List[str]:
+    """
+    Video filter and codec options for encoder; quality is on x264's CRF scale.
+    
+    vf runs in software; VA-API then needs the frames uploaded to the
+    device. A final "W:H" resize given as scale runs after the upload on
+    VA-API and NVENC (scale_vaapi / scale_cuda), in software otherwise.
+    """
+    filters = [vf] if vf else []
+    if encoder == 'h264_vaapi':
+        filters += ['format=nv12', 'hwupload']
+        if scale:
+            filters += [f'scale_vaapi={scale}', 'setsar=1']
+        return ['-vf', ','.join(filters), '-c:v', 'h264_vaapi', '-qp', str(quality)]
+    
+    if encoder == 'h264_nvenc' and scale:
+        # Frames stay in CUDA memory from the scaler to the encoder, so no
+        # -pix_fmt conversion after it
+        filters += ['format=yuv420p', 'hwupload_cuda', f'scale_cuda={scale}', 'setsar=1']
+        return [
+            '-vf', ','.join(filters),
+            '-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll', '-rc', 'vbr', '-cq', str(quality)
+        ]
+    
+    if scale:
+        filters += [f'scale={scale}', 'setsar=1']
+    args = ['-vf', ','.join(filters)] if filters else []
+    if encoder == 'h264_nvenc':
+        # p1 is NVENC's fastest preset; constant-quality VBR stands in for CRF
+        args += ['-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll', '-rc', 'vbr', '-cq', str(quality), '-pix_fmt', 'yuv420p']
+    elif encoder == 'h264_qsv':
+        args += ['-c:v', 'h264_qsv', '-preset', 'veryfast', '-global_quality', str(quality), '-pix_fmt', 'nv12']
+    else:
+        args += ['-c:v', 'libx264', '-preset', 'ultrafast', *X264_LOW_MEMORY, '-crf', str(quality)]
+        if single_thread:
+            args += ['-x264-params', 'threads=1:lookahead-threads=1']  # Force x264 to use 1 thread
+        args += ['-pix_fmt', 'yuv420p']
+    return args
+
+
+def _encoder_works(encoder: str) -> bool:
+    # Encode one frame: -encoders only lists what FFmpeg was built with, not
+    # whether the GPU and driver are actually there
+    cmd = [
+        FFMPEG_PATH,
+        *FFMPEG_QUIET,
+        *encoder_global_args(encoder),
+        '-f', 'lavfi', '-i', 'color=black:s=256x256',
+        '-frames:v', '1',
+        *h264_encode_args(encoder, 30),
+        '-f', 'null', '-'
+    ]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+@lru_cache(maxsize=1)
+def video_encoder() -> str:
+    """The H.264 encoder to use: VIDEO_ENCODER, or the first hardware one that works."""
+    if settings.video_encoder != "auto":
+        return settings.video_encoder
+    for encoder in HARDWARE_ENCODERS:
+        if _encoder_works(encoder):
+            log.info("[Video] Using hardware encoder: %s", encoder)
+            return encoder
+    return 'libx264'
+
+
+async def _read_tail(stream: asyncio.StreamReader, limit: int) -> bytes:
+    # Drain the pipe to EOF, keeping only its last limit bytes
+    tail = b''
+    while chunk := await stream.read(65536):
+        tail = (tail + chunk)[-limit:]
+    return tail
+
+
+async def _run_ffmpeg(cmd: List[str], capture_stdout: bool = False) -> subprocess.CompletedProcess:
+    """
+    Run an FFmpeg/ffprobe command as an asyncio subprocess.
+    
+    The event loop keeps serving requests while it runs, and the process
+    runs under nice so encodes don't starve it; output comes back decoded,
+    in the shape subprocess.run returns. Only the last STDERR_TAIL_BYTES of
+    stderr are kept, and stdout is discarded unless capture_stdout is set
+    (ffprobe's JSON).
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *FFMPEG_NICE,
+        *cmd,
+        stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    readers = [_read_tail(proc.stderr, STDERR_TAIL_BYTES)]
+    if capture_stdout:
+        readers.append(proc.stdout.read())
+    stderr, *stdout = await asyncio.gather(*readers)
+    await proc.wait()
+    return subprocess.CompletedProcess(
+        cmd,
+        proc.returncode,
+        stdout[0].decode(errors='replace') if stdout else '',
+        stderr.decode(errors='replace')
+    )
+
+
+def _available_memory_mb() -> Optional[float]:
+    """MB free for new processes, within the container's limit if any; None if unknown."""
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        pass
+    # cgroup v2; /proc/meminfo reports the host's memory inside a container
+    try:
+        with open('/sys/fs/cgroup/memory.max') as f:
+            limit = f.read().strip()
+        if limit != 'max':
+            with open('/sys/fs/cgroup/memory.current') as f:
+                cgroup_free = (int(limit) - int(f.read())) / (1024 * 1024)
+            available = cgroup_free if available is None else min(available, cgroup_free)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+async def _wait_for_memory(context: str):
+    # Hold a new encode back while memory is short instead of letting
+    # concurrent FFmpeg runs push the host into swap; gives up waiting
+    # after MEMORY_WAIT_TIMEOUT so a misread limit can't stall the pipeline
+    min_free = settings.ffmpeg_min_free_mb
+    if not min_free:
+        return
+    waited = 0.0
+    while waited < MEMORY_WAIT_TIMEOUT:
+        available = _available_memory_mb()
+        if available is None or available >= min_free:
+            return
+        if not waited:
+            log.info("[Video] %s: %.0f MB free, waiting for %s MB", context, available, min_free)
+        await asyncio.sleep(MEMORY_POLL_SECONDS)
+        waited += MEMORY_POLL_SECONDS
+
+
+async def _run_encode(build_cmd: Callable[[str], List[str]], context: str) -> subprocess.CompletedProcess:
+    """Run build_cmd(encoder), retrying once on libx264 if a hardware encoder fails."""
+    # The first call probes the encoders, which blocks; later calls are cached
+    encoder = await asyncio.to_thread(video_encoder)
+    await _wait_for_memory(context)
+    result = await _run_ffmpeg(build_cmd(encoder))
+    if result.returncode != 0 and encoder != 'libx264':
+        log_ffmpeg_error(result, f"{context}_{encoder}")
+        result = await _run_ffmpeg(build_cmd('libx264'))
+    return result
+
 
 def log_ffmpeg_error(result: subprocess.CompletedProcess, context: str):
     """Log FFmpeg errors for debugging."""
-    print(f"[FFmpeg Error - {context}] Exit code: {result.returncode}")
-    print(f"[FFmpeg Error - {context}] Stderr: {result.stderr[:1000] if result.stderr else 'None'}")
-    print(f"[FFmpeg Error - {context}] Stdout: {result.stdout[:500] if result.stdout else 'None'}")
+    log.warning("[FFmpeg Error - %s] Exit code: %s", context, result.returncode)
+    log.warning("[FFmpeg Error - %s] Stderr: %s", context, result.stderr[-1000:] if result.stderr else 'None')  # The error is at the end
+    log.warning("[FFmpeg Error - %s] Stdout: %s", context, result.stdout[:500] if result.stdout else 'None')
 
 
-def get_video_duration(video_path: str) -> int:
-    """Get video duration in seconds using ffprobe."""
+@lru_cache(maxsize=32)
+def _probe_duration(video_path: str, mtime_ns: int, size: int) -> float:
+    # Keyed on the file's mtime and size so a rewritten path is re-probed;
+    # failures raise and so are never cached
+    cmd = [
+        FFPROBE_PATH,
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return float(orjson.loads(result.stdout)["format"]["duration"])
+
+
+def get_video_duration(video_path: str) -> float:
+    """Get video duration in seconds using ffprobe (memoized per file version)."""
     try:
-        cmd = [
-            FFPROBE_PATH,
-            '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            video_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return int(float(result.stdout.strip()))
+        stat = os.stat(video_path)
+        return _probe_duration(video_path, stat.st_mtime_ns, stat.st_size)
     except Exception as e:
-        print(f"[Video] Failed to get duration for {video_path}: {e}")
-        return 0
+        log.warning("[Video] Failed to get duration for %s: %s", video_path, e)
+        return 0.0
 
 
-async def normalize_video(video_path: str, output_path: str) -> bool:
-    """Normalize video to standard H.264/AAC format for reliable processing."""
-    import asyncio
+async def probe_streams(video_path: str) -> Optional[Dict[str, Any]]:
+    """ffprobe's format and stream info for a file, or None if it can't be read."""
+    cmd = [
+        FFPROBE_PATH,
+        '-v', 'error',
+        '-show_entries', 'format=format_name,duration:stream=codec_type,codec_name,pix_fmt,width,height',
+        '-of', 'json',
+        video_path
+    ]
+    try:
+        result = await _run_ffmpeg(cmd, capture_stdout=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"exit code {result.returncode}")
+        return orjson.loads(result.stdout)
+    except Exception as e:
+        log.warning("[Video] Failed to probe streams for %s: %s", video_path, e)
+        return None
+
+
+def _is_normalized(probe: Optional[Dict[str, Any]]) -> bool:
+    # Already what normalization produces: H.264 yuv420p video no larger than
+    # MAX_NORMALIZED_SIZE and AAC audio in an MP4/MOV container
+    if not probe:
+        return False
+    formats = probe.get("format", {}).get("format_name", "").split(",")
+    if "mp4" not in formats and "mov" not in formats:
+        return False
+    streams = probe.get("streams", [])
+    video = [st for st in streams if st.get("codec_type") == "video"]
+    audio = [st for st in streams if st.get("codec_type") == "audio"]
+    return (
+        bool(video)
+        and all(
+            st.get("codec_name") == "h264"
+            and st.get("pix_fmt") == "yuv420p"
+            and max(st.get("width", 0), st.get("height", 0)) <= MAX_NORMALIZED_SIZE
+            for st in video
+        )
+        and all(st.get("codec_name") == "aac" for st in audio)
+    )
 
-    print(f"[Video] Normalizing: {video_path} -> {output_path}")
-    print(f"[Video] Input exists: {os.path.exists(video_path)}")
-    print(f"[Video] Using FFmpeg: {FFMPEG_PATH}")
+
+async def normalize_video(video_path: str, output_path: str, probe: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Normalize video to standard H.264/AAC format for reliable processing.
+    
+    probe is probe_streams(video_path) when the caller already has it.
+    """
+    log.info("[Video] Normalizing: %s -> %s", video_path, output_path)
+    log.info("[Video] Input exists: %s", os.path.exists(video_path))
+    log.info("[Video] Using FFmpeg: %s", FFMPEG_PATH)
 
     if not os.path.exists(video_path):
-        print(f"[Video] ERROR: Input file not found: {video_path}")
+        log.error("[Video] ERROR: Input file not found: %s", video_path)
         return False
 
-    # First attempt: standard normalization with error recovery for corrupted frames
-    cmd = [
-        FFMPEG_PATH,
-        '-y',
-        '-err_detect', 'ignore_err',  # Ignore decode errors (helps with .mov files)
-        '-i', video_path,
-        '-c:v', 'libx264',
-        '-preset', 'ultrafast',
-        '-crf', '23',
-        '-pix_fmt', 'yuv420p',
-        '-c:a', 'aac',
-        '-b:a', '128k',
-        '-movflags', '+faststart',
-        '-fflags', '+genpts',  # Generate presentation timestamps if missing
-        output_path
-    ]
+    # Fast path: inputs that are already H.264/AAC MP4 only need a remux
+    # (faststart), which runs at disk speed instead of encoder speed
+    if probe is None:
+        probe = await probe_streams(video_path)
+    if _is_normalized(probe):
+        cmd = [
+            FFMPEG_PATH,
+            *FFMPEG_QUIET,
+            '-y',
+            '-i', video_path,
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            output_path
+        ]
+        result = await _run_ffmpeg(cmd)
+        if result.returncode == 0:
+            log.info("[Video] Normalization successful (stream copy): %s", output_path)
+            return True
+        log_ffmpeg_error(result, "normalize_video_copy")
+
+    # Standard normalization with error recovery for corrupted frames
+    def build_cmd(encoder: str) -> List[str]:
+        return [
+            FFMPEG_PATH,
+            *FFMPEG_QUIET,
+            '-y',
+            *encoder_global_args(encoder),
+            '-err_detect', 'ignore_err',  # Ignore decode errors (helps with .mov files)
+            *FFMPEG_HWACCEL,
+            '-i', video_path,
+            *h264_encode_args(encoder, 23, NORMALIZED_SCALE),
+            *NORMALIZED_KEYFRAMES,
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            '-movflags', '+faststart',
+            '-fflags', '+genpts',  # Generate presentation timestamps if missing
+            output_path
+        ]
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    result = await _run_encode(build_cmd, "normalize_video")
     if result.returncode == 0:
-        print(f"[Video] Normalization successful: {output_path}")
+        log.info("[Video] Normalization successful: %s", output_path)
         return True
     
     # Second attempt: more aggressive error recovery for problematic files
-    print(f"[Video] First attempt failed, trying with more aggressive error recovery...")
+    log.warning("[Video] First attempt failed, trying with more aggressive error recovery...")
     cmd2 = [
         FFMPEG_PATH,
+        *FFMPEG_QUIET,
         '-y',
         '-fflags', '+discardcorrupt',  # Discard corrupted frames
         '-err_detect', 'ignore_err',
         '-i', video_path,
+        '-vf', NORMALIZED_SCALE,
         '-c:v', 'libx264',
         '-preset', 'ultrafast',
+        *X264_LOW_MEMORY,
         '-crf', '28',  # Lower quality but more resilient
         '-pix_fmt', 'yuv420p',
+        *NORMALIZED_KEYFRAMES,
         '-c:a', 'aac',
         '-b:a', '96k',
         '-movflags', '+faststart',
         output_path
     ]
     
-    result2 = subprocess.run(cmd2, capture_output=True, text=True)
+    result2 = await _run_ffmpeg(cmd2)
     if result2.returncode == 0:
-        print(f"[Video] Normalization successful (recovery mode): {output_path}")
+        log.info("[Video] Normalization successful (recovery mode): %s", output_path)
         return True
     
     log_ffmpeg_error(result, "normalize_video")
@@ -102,185 +401,168 @@ async def normalize_video(video_path: str, output_path: str) -> bool:
     return False
 
 
-async def extract_moment_clips(moments: List[Moment], video_path: str, project_id: str, db: Session):
-    """Extract video clips for each moment."""
-    
-    output_dir = os.path.join(settings.temp_dir, str(project_id), "clips")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # First, normalize the input video to ensure codec compatibility
-    normalized_path = os.path.join(settings.temp_dir, str(project_id), "normalized.mp4")
-    print(f"Normalizing video: {video_path} -> {normalized_path}")
-    
-    if not await normalize_video(video_path, normalized_path):
-        print("Failed to normalize video, trying with original...")
-        normalized_path = video_path  # Fall back to original
-    else:
-        print("Video normalized successfully")
-        video_path = normalized_path
-    
-    import asyncio
-    
-    # Sort moments by importance
-    sorted_moments = sorted(moments, key=lambda m: m.importance_score or 0, reverse=True)
-    
-    # Track success/failure
-    clips_created = 0
-    clips_failed = 0
-    
-    # Process top 3 moments only (reduce memory pressure)
-    for i, moment in enumerate(sorted_moments[:3]):
-        # Calculate actual moment duration from analysis
-        actual_duration = float(moment.end_time or 0) - float(moment.start_time or 0)
-        
-        # Use actual moment duration if it's reasonable (5-30s), otherwise default to 15s
-        if 5.0 <= actual_duration <= 30.0:
-            clip_duration = int(actual_duration)
-            print(f"Processing moment {i+1}: Using actual duration {clip_duration}s (from {moment.start_time:.1f}s to {moment.end_time:.1f}s)")
-        else:
-            clip_duration = 15
-            print(f"Processing moment {i+1}: Using default 15s duration (actual was {actual_duration:.1f}s)")
-        
-        # Main clip - use actual moment boundaries
-        try:
-            print(f"Processing moment {i+1}: main clip ({clip_duration}s)...")
-            await extract_clip(
-                video_path, 
-                float(moment.start_time),
-                clip_duration,
-                os.path.join(output_dir, f"moment_{i+1}_main.mp4"),
-                moment,
-                project_id,
-                db
-            )
-            clips_created += 1
-            await asyncio.sleep(2)  # Longer delay between clips
-        except Exception as e:
-            print(f"Error extracting main clip for moment {i+1}: {e}")
-            clips_failed += 1
-        
-        # 5-second micro-clip (best quote only)
-        try:
-            print(f"Processing moment {i+1}: 5s micro-clip...")
-            await extract_clip(
-                video_path,
-                float(moment.start_time),
-                5,
-                os.path.join(output_dir, f"moment_{i+1}_micro.mp4"),
-                moment,
-                project_id,
-                db,
-                is_micro=True
-            )
-            clips_created += 1
-            await asyncio.sleep(2)
-        except Exception as e:
-            print(f"Error extracting micro clip for moment {i+1}: {e}")
-            clips_failed += 1
-        
-        # Vertical version (most memory intensive) - use actual duration
-        print(f"Processing moment {i+1}: vertical version...")
-        try:
-            await create_vertical_version(
-                video_path,
-                float(moment.start_time),
-                clip_duration,
-                os.path.join(output_dir, f"moment_{i+1}_vertical.mp4"),
-                moment,
-                project_id,
-                db
-            )
-            clips_created += 1
-            await asyncio.sleep(2)
-        except Exception as e:
-            print(f"Error extracting vertical clip for moment {i+1}: {e}")
-            clips_failed += 1
-    
-    print(f"Clip extraction complete: {clips_created} created, {clips_failed} failed")
-    
-    # Clean up normalized file
-    if normalized_path != video_path and os.path.exists(normalized_path):
-        os.remove(normalized_path)
+# Moments whose clips are encoded at once
+CLIP_ENCODE_CONCURRENCY = settings.max_concurrent_ffmpeg or os.cpu_count() or 2
 
+# Per-output encoding for moment clips; low-memory settings for Railway free tier
+CLIP_480P = {
+    "name": "480p",
+    "filter": 'scale=480:-2',  # Lower resolution to save memory
+    "scale": None,
+    "quality": 30,  # Higher CRF = lower quality but much faster
+    "audio_bitrate": '64k',
+    "single_thread": True,
+}
+# 720x1280 frames from any input: a centre 9:16 crop then one scale, or the
+# whole frame scaled down and padded with black bars (a second full-frame
+# pass, worth it for wide shots). Each is (software filter, final resize);
+# the crop's resize can run on the GPU
+VERTICAL_FILTERS = {
+    "crop": ("crop=w='min(iw,ih*9/16)':h='min(ih,iw*16/9)'", '720:1280'),
+    "letterbox": ('scale=720:1280:force_original_aspect_ratio=decrease,pad=720:1280:(ow-iw)/2:(oh-ih)/2:black', None),
+}
+CLIP_VERTICAL = {
+    "name": "vertical",
+    "filter": VERTICAL_FILTERS[settings.vertical_clip_mode][0],
+    "scale": VERTICAL_FILTERS[settings.vertical_clip_mode][1],
+    "quality": 28,
+    "audio_bitrate": '96k',
+    "single_thread": False,
+}
 
-async def extract_clip(
-    video_path: str, 
-    start_time: float, 
-    duration: int,
-    output_path: str,
-    moment: Moment,
-    project_id: str,
-    db: Session,
-    is_micro: bool = False
-):
-    """Extract a single clip from video and upload to storage."""
-    import asyncio
-    from app.services.storage import upload_to_drive, create_folder
-    
-    # Ensure we don't exceed video bounds
-    video_duration = get_video_duration(video_path)
-    if start_time + duration > video_duration:
-        duration = int(video_duration - start_time)
+
+CLIP_PROFILES = {profile["name"]: profile for profile in (CLIP_480P, CLIP_VERTICAL)}
+
+
+@lru_cache(maxsize=None)
+def _profile_encode_args(name: str, encoder: str) -> Tuple[str, ...]:
+    # Static for a process (settings and the probed encoder don't change),
+    # so each profile's ~20 output options are built once per encoder
+    profile = CLIP_PROFILES[name]
+    return (
+        *h264_encode_args(encoder, profile["quality"], profile["filter"], profile["single_thread"], profile["scale"]),
+        '-c:a', 'aac',
+        '-b:a', profile["audio_bitrate"],
+        '-movflags', '+faststart',
+    )
+
+
+def clip_encode_args(profile: Dict[str, Any], encoder: str) -> Tuple[str, ...]:
+    """Output options for one clip profile."""
+    return _profile_encode_args(profile["name"], encoder)
+
+
+def _moment_clip_outputs(moment: Moment, index: int, clip_duration: int, output_dir: str) -> List[Dict[str, Any]]:
+    """The three clips cut for a moment: main, 5-second micro and vertical."""
+    summary = moment.summary
+    return [
+        {
+            "path": os.path.join(output_dir, f"moment_{index}_main.mp4"),
+            "duration": clip_duration,
+            "profile": CLIP_480P,
+            "asset_type": "video_clip",
+            "title": f"Clip: {summary[:50] if summary else 'Moment'}",
+            "dimensions": "480p",
+        },
+        {
+            # Best quote only
+            "path": os.path.join(output_dir, f"moment_{index}_micro.mp4"),
+            "duration": 5,
+            "profile": CLIP_480P,
+            "asset_type": "video_micro",
+            "title": f"Micro Clip: {summary[:50] if summary else 'Moment'}",
+            "dimensions": "480p",
+        },
+        {
+            "path": os.path.join(output_dir, f"moment_{index}_vertical.mp4"),
+            "duration": clip_duration,
+            "profile": CLIP_VERTICAL,
+            "asset_type": "video_vertical",
+            "title": f"Vertical: {summary[:40] if summary else 'Moment'}",
+            "dimensions": "720x1280",
+        },
+    ]
+
+
+def _moment_clips_command(video_path: str, start_time: float, outputs: List[Dict[str, Any]], encoder: str) -> List[str]:
+    """
+    One FFmpeg run writing every output for a moment.
     
-    # Low-memory encoding - aggressive settings for Railway free tier
+    The input is demuxed and decoded once and each decoded frame is fed to
+    every output's filter and encoder, instead of one process (and one full
+    decode) per clip. Seeking on the input jumps to the keyframe before
+    start_time rather than decoding everything ahead of it; FFmpeg still
+    trims to the exact frame when transcoding.
+    """
     cmd = [
         FFMPEG_PATH,
+        *FFMPEG_QUIET,
         '-y',
+        *encoder_global_args(encoder),
         '-threads', '1',
-        '-i', video_path,
+        *FFMPEG_HWACCEL,
         '-ss', str(start_time),
-        '-t', str(duration),
-        '-vf', 'scale=480:-2',  # Lower resolution to save memory
-        '-c:v', 'libx264',
-        '-preset', 'ultrafast',
-        '-crf', '30',  # Higher CRF = lower quality but much faster
-        '-x264-params', 'threads=1:lookahead-threads=1',  # Force x264 to use 1 thread
-        '-pix_fmt', 'yuv420p',
-        '-c:a', 'aac',
-        '-b:a', '64k',
-        '-movflags', '+faststart',
-        output_path
+        '-i', video_path,
     ]
+    for output in outputs:
+        cmd.extend([
+            '-t', str(output["duration"]),
+            *clip_encode_args(output["profile"], encoder),
+            output["path"]
+        ])
+    return cmd
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        log_ffmpeg_error(result, f"extract_clip_{duration}s")
-        raise Exception(f"FFmpeg failed with code {result.returncode}")
-    
-    # Small delay to let memory settle between clips
-    await asyncio.sleep(0.5)
+
+def _segments_command(video_path: str, jobs: List[Tuple[float, float, str]], encoder: str) -> List[str]:
+    """
+    One FFmpeg run cutting (start_time, duration, output_path) segments.
     
-    # Get file size
-    file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
+    Each segment is its own input-side seek into video_path, so only the
+    frames it needs are decoded, but the process and codec setup are paid
+    once instead of per segment. Encoded like a moment's main clip.
+    """
+    cmd = [
+        FFMPEG_PATH,
+        *FFMPEG_QUIET,
+        '-y',
+        *encoder_global_args(encoder),
+    ]
+    for start_time, duration, _ in jobs:
+        cmd.extend([
+            '-threads', '1',  # Per input: decoder threads
+            *FFMPEG_HWACCEL,
+            '-ss', str(start_time),
+            '-t', str(duration),
+            '-i', video_path,
+        ])
+    for index, (_, _, output_path) in enumerate(jobs):
+        cmd.extend([
+            '-map', f'{index}:v:0',
+            '-map', f'{index}:a:0?',
+            *clip_encode_args(CLIP_480P, encoder),
+            output_path
+        ])
+    return cmd
+
+
+async def _publish_clip(row: Dict[str, Any]):
+    """
+    Upload a rendered clip to Drive, falling back to serving it locally.
     
-    # Create asset record first (pending status)
-    asset_type = "video_micro" if is_micro else "video_clip"
-    asset = Asset(
-        project_id=project_id,
-        moment_id=moment.id,
-        asset_type=asset_type,
-        title=f"{'Micro ' if is_micro else ''}Clip: {moment.summary[:50] if moment.summary else 'Moment'}",
-        file_path=output_path,
-        file_size_mb=file_size,
-        duration_seconds=duration,
-        dimensions="480p",
-        format="mp4",
-        status="processing"
-    )
-    db.add(asset)
-    db.commit()
+    Only sets the asset row's file_url and status; the caller inserts it.
+    """
+    from app.services.storage import upload_to_drive
     
-    # Upload to Google Drive for persistent storage
+    output_path = row["file_path"]
     filename = os.path.basename(output_path)
     
     try:
         file_url = await upload_to_drive(output_path, filename)
-        asset.file_url = file_url
-        asset.status = "completed"
-        db.commit()
-        print(f"[Video] Uploaded to Drive: {file_url}")
+        row["file_url"] = file_url
+        row["status"] = "completed"
+        log.info("[Video] Uploaded %s to Drive: %s", filename, file_url)
     except Exception as e:
-        print(f"[Video] Drive upload failed, using local URL: {e}")
+        log.warning("[Video] Drive upload failed for %s, using local URL: %s", filename, e)
         # Fallback: serve from Railway directly
         # Get project ID from output_path
         project_id_from_path = os.path.basename(os.path.dirname(os.path.dirname(output_path)))
@@ -293,98 +575,150 @@ async def extract_clip(
         else:
             full_url = local_url
             
-        asset.file_url = full_url
-        asset.status = "completed"
-        db.commit()
-        print(f"[Video] Using local URL: {full_url}")
+        row["file_url"] = full_url
+        row["status"] = "completed"
+        log.info("[Video] Using local URL: %s", full_url)
 
 
-async def create_vertical_version(
-    video_path: str,
-    start_time: float,
-    duration: int,
-    output_path: str,
-    moment: Moment,
-    project_id: str,
-    db: Session
-):
-    """Create vertical 9:16 version for mobile/social."""
-    import asyncio
-    from app.services.storage import upload_to_drive
-    
-    video_duration = get_video_duration(video_path)
-    if start_time + duration > video_duration:
-        duration = int(video_duration - start_time)
-    
-    # Low-memory vertical version - 720p vertical to avoid OOM
-    cmd = [
-        FFMPEG_PATH,
-        '-y',
-        '-threads', '1',  # Limit to single thread
-        '-i', video_path,
-        '-ss', str(start_time),
-        '-t', str(duration),
-        '-vf', 'scale=720:1280:force_original_aspect_ratio=decrease,pad=720:1280:(ow-iw)/2:(oh-ih)/2:black',
-        '-c:v', 'libx264',
-        '-preset', 'ultrafast',
-        '-crf', '28',
-        '-pix_fmt', 'yuv420p',
-        '-c:a', 'aac',
-        '-b:a', '96k',
-        '-movflags', '+faststart',
-        output_path
-    ]
+async def _drive_uploader(queue: asyncio.Queue):
+    """Publish clip asset rows as they are queued, until a None arrives."""
+    while (row := await queue.get()) is not None:
+        await _publish_clip(row)
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        log_ffmpeg_error(result, "create_vertical_version")
-        raise Exception(f"FFmpeg failed with code {result.returncode}")
+
+async def extract_moment_clips(moments: List[Moment], video_path: str, project_id: str, db: Session):
+    """Extract video clips for each moment, rendering the moments concurrently."""
+    output_dir = os.path.join(settings.temp_dir, str(project_id), "clips")
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # First, normalize the input video to ensure codec compatibility. The
+    # clips seek into it independently, so it has to be a real file (no
+    # FIFO); an input that is already H.264/AAC MP4 is used in place
+    normalized_path = os.path.join(settings.temp_dir, str(project_id), "normalized.mp4")
     
-    # Small delay to let memory settle
-    await asyncio.sleep(0.5)
+    # One ffprobe answers both whether to normalize and, if not, the duration
+    probe = await probe_streams(video_path)
+    video_duration = None
     
-    file_size = os.path.getsize(output_path) / (1024 * 1024)
+    if _is_normalized(probe):
+        log.info("Video already normalized, cutting clips from: %s", video_path)
+        normalized_path = None
+        video_duration = float(probe["format"].get("duration", 0))
+    else:
+        log.info("Normalizing video: %s -> %s", video_path, normalized_path)
+        if not await normalize_video(video_path, normalized_path, probe):
+            log.warning("Failed to normalize video, trying with original...")
+            normalized_path = None  # Fall back to original
+        else:
+            log.info("Video normalized successfully")
+            video_path = normalized_path
     
-    asset = Asset(
-        project_id=project_id,
-        moment_id=moment.id,
-        asset_type="video_vertical",
-        title=f"Vertical: {moment.summary[:40] if moment.summary else 'Moment'}",
-        file_path=output_path,
-        file_size_mb=file_size,
-        duration_seconds=duration,
-        dimensions="720x1280",
-        format="mp4",
-        status="processing"
-    )
-    db.add(asset)
-    db.commit()
+    # Top 3 moments by importance (reduce memory pressure)
+    top_moments = heapq.nlargest(3, moments, key=lambda m: m.importance_score or 0)
     
-    # Upload to Google Drive for persistent storage
-    filename = os.path.basename(output_path)
+    # One probe for every clip bound below
+    if video_duration is None:
+        video_duration = await asyncio.to_thread(get_video_duration, video_path)
     
-    try:
-        file_url = await upload_to_drive(output_path, filename)
-        asset.file_url = file_url
-        asset.status = "completed"
-        db.commit()
-        print(f"[Video] Uploaded vertical to Drive: {file_url}")
-    except Exception as e:
-        print(f"[Video] Drive upload failed for vertical, using local URL: {e}")
-        # Fallback: serve from Railway directly
-        project_id_from_path = os.path.basename(os.path.dirname(os.path.dirname(output_path)))
-        local_url = f"/clips/{project_id_from_path}/clips/{filename}"
+    async def render(i: int, moment: Moment) -> Tuple[List[Dict[str, Any]], int]:
+        start_time = float(moment.start_time)
         
-        railway_url = os.getenv("RAILWAY_PUBLIC_DOMAIN", "")
-        if railway_url:
-            full_url = f"https://{railway_url}{local_url}"
+        # Calculate actual moment duration from analysis
+        actual_duration = float(moment.end_time or 0) - float(moment.start_time or 0)
+        
+        # Use actual moment duration if it's reasonable (5-30s), otherwise default to 15s
+        if 5.0 <= actual_duration <= 30.0:
+            clip_duration = int(actual_duration)
+            log.info("Processing moment %s: Using actual duration %ss (from %.1fs to %.1fs)", i+1, clip_duration, moment.start_time, moment.end_time)
         else:
-            full_url = local_url
-            
-        asset.file_url = full_url
-        asset.status = "completed"
-        db.commit()
-        print(f"[Video] Using local URL for vertical: {full_url}")
+            clip_duration = 15
+            log.info("Processing moment %s: Using default 15s duration (actual was %.1fs)", i+1, actual_duration)
+        
+        outputs = _moment_clip_outputs(moment, i + 1, clip_duration, output_dir)
+        
+        # Ensure we don't exceed video bounds (unknown when the probe failed)
+        if video_duration:
+            remaining = video_duration - start_time
+            if remaining <= 0:
+                # Moment starts past the end of the (normalized) video; an
+                # FFmpeg run would only fail on the negative -t
+                log.warning("Skipping moment %s: starts at %.1fs, video is %.1fs", i+1, start_time, video_duration)
+                return [], len(outputs)
+            for output in outputs:
+                output["duration"] = min(output["duration"], remaining)
+        
+        async with encode_slots:
+            log.info("Processing moment %s: main, micro and vertical clips in one pass...", i+1)
+            result = await _run_encode(
+                lambda encoder: _moment_clips_command(video_path, start_time, outputs, encoder),
+                f"extract_moment_clips_{i+1}"
+            )
+        if result.returncode != 0:
+            log_ffmpeg_error(result, f"extract_moment_clips_{i+1}")
+            return [], len(outputs)
+        
+        # Rows are only built here; every moment's go to the DB in one INSERT
+        rows = [
+            {
+                "project_id": project_id,
+                "moment_id": moment.id,
+                "asset_type": output["asset_type"],
+                "title": output["title"],
+                "file_path": output["path"],
+                "file_size_mb": os.path.getsize(output["path"]) / (1024 * 1024),  # MB
+                "duration_seconds": round(output["duration"]),
+                "dimensions": output["dimensions"],
+                "format": "mp4",
+                "file_url": None,  # Set by the uploader
+                "status": "processing"
+            }
+            for output in outputs
+        ]
+        
+        # Hand off and free the slot: the next encode starts while these upload
+        for row in rows:
+            upload_queue.put_nowait(row)
+        return rows, 0
+    
+    # Each FFmpeg run is single-threaded per output, so one per core; the
+    # semaphore replaces the old fixed pause between moments
+    encode_slots = asyncio.Semaphore(CLIP_ENCODE_CONCURRENCY)
+    upload_queue: asyncio.Queue = asyncio.Queue()
+    uploader = asyncio.create_task(_drive_uploader(upload_queue))
+    try:
+        results = await asyncio.gather(
+            *(render(i, moment) for i, moment in enumerate(top_moments)),
+            return_exceptions=True
+        )
+    finally:
+        upload_queue.put_nowait(None)
+        await uploader
+    
+    # Track success/failure
+    asset_rows = []
+    clips_failed = 0
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            log.warning("Error extracting clips for moment %s: %s", i+1, result)
+            clips_failed += 3
+            continue
+        asset_rows.extend(result[0])
+        clips_failed += result[1]
+    clips_created = len(asset_rows)
+    
+    # One INSERT and commit for every clip, URLs already resolved; no ORM
+    # objects to track
+    if asset_rows:
+        def save_assets():
+            bulk_insert(db, Asset, asset_rows)
+            db.commit()
+        await asyncio.to_thread(save_assets)
+    
+    log.info("Clip extraction complete: %s created, %s failed", clips_created, clips_failed)
+    
+    # Clean up normalized file
+    if normalized_path and os.path.exists(normalized_path):
+        os.remove(normalized_path)
 
 
 async def add_captions(video_path: str, captions_srt: str, output_path: str):
@@ -415,52 +749,47 @@ async def stitch_clips(
         db: Database session
         add_transitions: Whether to add fade transitions between clips
     """
-    import asyncio
     import tempfile
     from app.services.storage import upload_to_drive
     
-    print(f"[Stitch] Starting stitch for {story_name} with {len(segments)} segments")
+    log.info("[Stitch] Starting stitch for %s with %s segments", story_name, len(segments))
     
     # Create temp directory for intermediate files
     temp_dir = tempfile.mkdtemp(prefix="stitch_")
     segment_files = []
     
     try:
-        # Step 1: Extract each segment
-        for i, (start_time, duration) in enumerate(segments):
-            segment_path = os.path.join(temp_dir, f"segment_{i:03d}.mp4")
-            
-            # Extract segment with same settings as extract_clip
-            cmd = [
-                FFMPEG_PATH,
-                '-y',
-                '-threads', '1',
-                '-i', video_path,
-                '-ss', str(start_time),
-                '-t', str(duration),
-                '-vf', 'scale=480:-2',
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',
-                '-crf', '30',
-                '-x264-params', 'threads=1:lookahead-threads=1',
-                '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac',
-                '-b:a', '64k',
-                '-movflags', '+faststart',
-                segment_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                log_ffmpeg_error(result, f"stitch_segment_{i}")
-                continue
-            
-            segment_files.append(segment_path)
-            print(f"[Stitch] Extracted segment {i+1}/{len(segments)}: {duration}s at {start_time}s")
-            await asyncio.sleep(0.3)
+        # Step 1: Extract the segments, all in one FFmpeg run
+        jobs = [
+            (start_time, duration, os.path.join(temp_dir, f"segment_{i:03d}.mp4"))
+            for i, (start_time, duration) in enumerate(segments)
+        ]
+        result = await _run_encode(
+            lambda encoder: _segments_command(video_path, jobs, encoder),
+            "stitch_segments"
+        )
+        if result.returncode == 0:
+            segment_files = [path for _, _, path in jobs]
+            log.info("[Stitch] Extracted %s segments in one pass", len(jobs))
+        else:
+            # One bad segment fails the whole run; retry them separately so
+            # the rest can still be stitched
+            log_ffmpeg_error(result, "stitch_segments")
+            for i, job in enumerate(jobs):
+                # Awaited as a subprocess so concurrent stitches overlap
+                result = await _run_encode(
+                    lambda encoder: _segments_command(video_path, [job], encoder),
+                    f"stitch_segment_{i}"
+                )
+                if result.returncode != 0:
+                    log_ffmpeg_error(result, f"stitch_segment_{i}")
+                    continue
+                
+                segment_files.append(job[2])
+                log.info("[Stitch] Extracted segment %s/%s: %ss at %ss", i+1, len(segments), job[1], job[0])
         
         if len(segment_files) < 2:
-            print(f"[Stitch] ERROR: Only {len(segment_files)} segments extracted, need at least 2")
+            log.error("[Stitch] ERROR: Only %s segments extracted, need at least 2", len(segment_files))
             return None
         
         # Step 2: Create concat file list
@@ -491,6 +820,7 @@ async def stitch_clips(
             
             cmd = [
                 FFMPEG_PATH,
+                *FFMPEG_QUIET,
                 '-y',
                 '-threads', '1'
             ]
@@ -505,6 +835,7 @@ async def stitch_clips(
                 '-map', '[outa]',
                 '-c:v', 'libx264',
                 '-preset', 'ultrafast',
+                *X264_LOW_MEMORY,
                 '-crf', '28',
                 '-pix_fmt', 'yuv420p',
                 '-c:a', 'aac',
@@ -516,6 +847,7 @@ async def stitch_clips(
             # Simple concat without transitions (more reliable)
             cmd = [
                 FFMPEG_PATH,
+                *FFMPEG_QUIET,
                 '-y',
                 '-threads', '1',
                 '-f', 'concat',
@@ -526,7 +858,7 @@ async def stitch_clips(
                 output_path
             ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = await _run_ffmpeg(cmd)
         if result.returncode != 0:
             log_ffmpeg_error(result, "stitch_concat")
             return None
@@ -535,7 +867,7 @@ async def stitch_clips(
         total_duration = sum(duration for _, duration in segments)
         file_size = os.path.getsize(output_path) / (1024 * 1024)
         
-        print(f"[Stitch] Success: {output_path} ({total_duration}s, {file_size:.1f}MB)")
+        log.info("[Stitch] Success: %s (%ss, %.1fMB)", output_path, total_duration, file_size)
         
         # Create asset record
         asset = Asset(
@@ -550,8 +882,9 @@ async def stitch_clips(
             format="mp4",
             status="processing"
         )
+        # Commits run in a worker thread so concurrent stitches keep encoding
         db.add(asset)
-        db.commit()
+        await asyncio.to_thread(db.commit)
         
         # Upload to Drive or use local URL
         filename = os.path.basename(output_path)
@@ -560,10 +893,10 @@ async def stitch_clips(
             file_url = await upload_to_drive(output_path, filename)
             asset.file_url = file_url
             asset.status = "completed"
-            db.commit()
-            print(f"[Stitch] Uploaded to Drive: {file_url}")
+            await asyncio.to_thread(db.commit)
+            log.info("[Stitch] Uploaded to Drive: %s", file_url)
         except Exception as e:
-            print(f"[Stitch] Drive upload failed, using local URL: {e}")
+            log.warning("[Stitch] Drive upload failed, using local URL: %s", e)
             project_id_from_path = os.path.basename(os.path.dirname(os.path.dirname(output_path)))
             local_url = f"/clips/{project_id_from_path}/clips/{filename}"
             
@@ -575,8 +908,8 @@ async def stitch_clips(
             
             asset.file_url = full_url
             asset.status = "completed"
-            db.commit()
-            print(f"[Stitch] Using local URL: {full_url}")
+            await asyncio.to_thread(db.commit)
+            log.info("[Stitch] Using local URL: %s", full_url)
         
         return asset
         
@@ -585,6 +918,6 @@ async def stitch_clips(
         import shutil
         try:
             shutil.rmtree(temp_dir)
-            print(f"[Stitch] Cleaned up temp files")
+            log.info("[Stitch] Cleaned up temp files")
         except Exception as e:
-            print(f"[Stitch] Cleanup error (non-critical): {e}")
+            log.warning("[Stitch] Cleanup error (non-critical): %s", e)
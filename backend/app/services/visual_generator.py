@@ -3,11 +3,216 @@ Visual Content Generation Service
 Generates images for content with priority: original > AI illustrations > stock
 """
 
+import asyncio
+import logging
 import os
-from typing import Dict, Any, List, Optional
+import uuid
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+import ahocorasick
+import aiofiles
 import httpx
+import orjson
 from dataclasses import dataclass
 
+log = logging.getLogger(__name__)
+
+# Shared client for the image/stock APIs (Unsplash, DALL-E); per-call
+# timeouts still apply, but connections are pooled across generations
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared visuals HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared visuals HTTP client (app shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def fetch_to_disk(url: str, dest: str) -> str:
+    """
+    Download url to dest, streaming it in chunks.
+    
+    The body is never held in memory whole, so concurrent downloads stay
+    bounded by the chunk size; a failed download leaves no partial file.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        async with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            async with aiofiles.open(dest, "wb") as f:
+                async for chunk in response.aiter_bytes(65536):
+                    await f.write(chunk)
+    except BaseException:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    return dest
+
+
+# Primary subjects (nouns/entities)
+SUBJECT_INDICATORS = {
+    'dog': ['dog', 'puppy', 'canine', 'pet', 'dogs'],
+    'person': ['i', 'we', 'my', 'client', 'customer', 'owner'],
+    'vehicle': ['van', 'car', 'truck'],
+    'location': ['home', 'house', 'office', 'facility']
+}
+
+# Mood/feeling
+EMOTION_INDICATORS = {
+    'joy': ['happy', 'excited', 'thrilled', 'joy', 'wagging', 'smiling'],
+    'trust': ['confident', 'comfortable', 'trust', 'safe', 'relaxed'],
+    'love': ['love', 'adore', 'obsessed', 'amazing', 'best'],
+    'relief': ['relieved', 'peace of mind', 'finally', 'no longer worried']
+}
+
+# What's happening
+ACTION_INDICATORS = {
+    'jumping': ['jump', 'hop', 'leap'],
+    'playing': ['play', 'run', 'chase'],
+    'interacting': ['hug', 'pet', 'cuddle', 'pick up'],
+    'transporting': ['van', 'pick up', 'drop off', 'ride']
+}
+
+# Supporting elements: (indicators, elements added when any is present)
+SECONDARY_INDICATORS = [
+    (['van', 'pick up'], ['van', 'transportation']),
+    (['tail', 'wagging'], ['tail', 'happy dog']),
+]
+
+_VISUAL_LABELS = {
+    'primary': tuple(SUBJECT_INDICATORS),
+    'emotional': tuple(EMOTION_INDICATORS),
+    'action': tuple(ACTION_INDICATORS),
+}
+
+
+def _build_visual_automaton() -> ahocorasick.Automaton:
+    """Map every indicator to the (category, label) keys it switches on."""
+    keys: Dict[str, List[Tuple[str, Any]]] = {}
+    for category, indicator_map in (
+        ('primary', SUBJECT_INDICATORS),
+        ('emotional', EMOTION_INDICATORS),
+        ('action', ACTION_INDICATORS),
+    ):
+        for label, indicators in indicator_map.items():
+            for indicator in indicators:
+                keys.setdefault(indicator, []).append((category, label))
+    for index, (indicators, _) in enumerate(SECONDARY_INDICATORS):
+        for indicator in indicators:
+            keys.setdefault(indicator, []).append(('secondary', index))
+    
+    automaton = ahocorasick.Automaton()
+    for indicator, indicator_keys in keys.items():
+        automaton.add_word(indicator, tuple(indicator_keys))
+    automaton.make_automaton()
+    return automaton
+
+
+_VISUAL_AUTOMATON = _build_visual_automaton()
+
+
+def _visual_keyword_hits(text_lower: str) -> set:
+    """(category, label) keys with at least one indicator in the text, in one pass."""
+    hits = set()
+    for _, indicator_keys in _VISUAL_AUTOMATON.iter(text_lower):
+        hits.update(indicator_keys)
+    return hits
+
+
+# Moments and their variations reuse the same quotes; both are pure
+# functions of the text, so repeats are served from these caches
+@lru_cache(maxsize=512)
+def _search_queries(text: str) -> Tuple[str, ...]:
+    """Prioritized stock search terms for text (extract_visual_keywords)."""
+    hits = _visual_keyword_hits(text.lower())
+    keywords = {
+        category: [label for label in labels if (category, label) in hits]
+        for category, labels in _VISUAL_LABELS.items()
+    }
+    keywords['secondary'] = [
+        element
+        for index, (_, elements) in enumerate(SECONDARY_INDICATORS)
+        if ('secondary', index) in hits
+        for element in elements
+    ]
+    
+    # Build search queries in priority order
+    search_queries = []
+    
+    # Primary + action combinations
+    for primary in keywords['primary']:
+        for action in keywords['action']:
+            search_queries.append(f"{action} {primary}")
+    
+    # Emotional + primary
+    for emotion in keywords['emotional']:
+        for primary in keywords['primary']:
+            search_queries.append(f"{emotion} {primary}")
+    
+    # Add secondary context
+    if keywords['secondary']:
+        search_queries.append(' '.join(keywords['secondary'][:2]))
+    
+    # Fallback to general
+    if keywords['primary']:
+        search_queries.append(keywords['primary'][0])
+    
+    return tuple(dict.fromkeys(search_queries))  # Remove duplicates
+
+
+@lru_cache(maxsize=512)
+def _ai_prompt(content: str) -> str:
+    """AI illustration prompt for content (build_ai_prompt)."""
+    keywords = _search_queries(content)
+    # One string to search instead of re-serializing the list per check
+    keyword_text = ' '.join(keywords).lower()
+    
+    # Build scene description
+    scene_elements = []
+    
+    if 'dog' in keyword_text:
+        scene_elements.append("a happy dog")
+    
+    if 'jump' in keyword_text:
+        scene_elements.append("jumping excitedly")
+    
+    if 'van' in keyword_text or 'transport' in keyword_text:
+        scene_elements.append("near a friendly dog transport van")
+    
+    if 'happy' in keyword_text or 'joy' in keyword_text:
+        scene_elements.append("with tail wagging")
+    
+    # Build the prompt
+    base_prompt = " ".join(scene_elements) if scene_elements else "a friendly pet care scene"
+    
+    # Add style modifiers (illustration, not photo)
+    style_modifiers = (
+        "warm, friendly illustration style. "
+        "Bright, cheerful colors. "
+        "Children's book illustration aesthetic. "
+        "Clean lines, flat design, not photorealistic. "
+        "White background or simple environment."
+    )
+    
+    full_prompt = f"{base_prompt}. {style_modifiers}"
+    
+    return full_prompt
+
+
 @dataclass
 class VisualAsset:
     asset_type: str  # 'original', 'ai_illustration', 'stock', 'quote_card'
@@ -17,6 +222,28 @@ class VisualAsset:
     keywords: List[str]
     confidence: float  # How well it matches the content
 
+
+def visual_file_columns(visual: VisualAsset) -> Dict[str, Any]:
+    """
+    id, file_url, file_path and format for a visual's asset row.
+    
+    A saved image is served by the asset download route, since its source
+    URL may expire; otherwise the row links to the source URL. Callers keep
+    the source URL in the row's extra["source_url"] either way.
+    """
+    asset_id = uuid.uuid4()
+    if not visual.local_path:
+        return {"id": asset_id, "file_url": visual.source_url, "file_path": None, "format": None}
+    
+    local_url = f"/api/assets/{asset_id}/download"
+    railway_url = os.getenv("RAILWAY_PUBLIC_DOMAIN", "")
+    return {
+        "id": asset_id,
+        "file_url": f"https://{railway_url}{local_url}" if railway_url else local_url,
+        "file_path": visual.local_path,
+        "format": "png",  # save_locally always writes PNG
+    }
+
 class VisualContentGenerator:
     """Generate visual assets for content with priority-based sourcing."""
     
@@ -31,78 +258,7 @@ class VisualContentGenerator:
         Extract visual keywords from text content.
         Returns prioritized list of search terms.
         """
-        text_lower = text.lower()
-        keywords = {
-            'primary': [],      # Main subjects
-            'secondary': [],    # Supporting elements
-            'emotional': [],    # Mood/feeling
-            'action': []        # What's happening
-        }
-        
-        # Primary subjects (nouns/entities)
-        subject_indicators = {
-            'dog': ['dog', 'puppy', 'canine', 'pet', 'dogs'],
-            'person': ['i', 'we', 'my', 'client', 'customer', 'owner'],
-            'vehicle': ['van', 'car', 'truck'],
-            'location': ['home', 'house', 'office', 'facility']
-        }
-        
-        for subject, indicators in subject_indicators.items():
-            if any(ind in text_lower for ind in indicators):
-                keywords['primary'].append(subject)
-        
-        # Emotional keywords
-        emotion_map = {
-            'joy': ['happy', 'excited', 'thrilled', 'joy', 'wagging', 'smiling'],
-            'trust': ['confident', 'comfortable', 'trust', 'safe', 'relaxed'],
-            'love': ['love', 'adore', 'obsessed', 'amazing', 'best'],
-            'relief': ['relieved', 'peace of mind', 'finally', 'no longer worried']
-        }
-        
-        for emotion, indicators in emotion_map.items():
-            if any(ind in text_lower for ind in indicators):
-                keywords['emotional'].append(emotion)
-        
-        # Action keywords
-        action_indicators = {
-            'jumping': ['jump', 'hop', 'leap'],
-            'playing': ['play', 'run', 'chase'],
-            'interacting': ['hug', 'pet', 'cuddle', 'pick up'],
-            'transporting': ['van', 'pick up', 'drop off', 'ride']
-        }
-        
-        for action, indicators in action_indicators.items():
-            if any(ind in text_lower for ind in indicators):
-                keywords['action'].append(action)
-        
-        # Secondary elements (context)
-        if 'van' in text_lower or 'pick up' in text_lower:
-            keywords['secondary'].extend(['van', 'transportation'])
-        if 'tail' in text_lower or 'wagging' in text_lower:
-            keywords['secondary'].extend(['tail', 'happy dog'])
-        
-        # Build search queries in priority order
-        search_queries = []
-        
-        # Primary + action combinations
-        for primary in keywords['primary']:
-            for action in keywords['action']:
-                search_queries.append(f"{action} {primary}")
-        
-        # Emotional + primary
-        for emotion in keywords['emotional']:
-            for primary in keywords['primary']:
-                search_queries.append(f"{emotion} {primary}")
-        
-        # Add secondary context
-        if keywords['secondary']:
-            search_queries.append(' '.join(keywords['secondary'][:2]))
-        
-        # Fallback to general
-        if keywords['primary']:
-            search_queries.append(keywords['primary'][0])
-        
-        return list(dict.fromkeys(search_queries))  # Remove duplicates
+        return list(_search_queries(text))
     
     async def search_stock_images(self, query: str, count: int = 3) -> List[VisualAsset]:
         """
@@ -110,39 +266,39 @@ class VisualContentGenerator:
         Returns list of VisualAsset objects.
         """
         if not self.unsplash_key:
-            print("[Visual] No Unsplash API key configured")
+            log.info("[Visual] No Unsplash API key configured")
             return []
         
         assets = []
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    "https://api.unsplash.com/search/photos",
-                    headers={"Authorization": f"Client-ID {self.unsplash_key}"},
-                    params={
-                        "query": query,
-                        "per_page": count,
-                        "orientation": "landscape"
-                    },
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    for photo in data.get('results', []):
-                        asset = VisualAsset(
-                            asset_type='stock',
-                            source_url=photo['urls']['regular'],
-                            local_path=None,
-                            alt_text=photo.get('alt_description', query),
-                            keywords=query.split(),
-                            confidence=0.6  # Stock is lower confidence
-                        )
-                        assets.append(asset)
-                        
+            client = get_http_client()
+            response = await client.get(
+                "https://api.unsplash.com/search/photos",
+                headers={"Authorization": f"Client-ID {self.unsplash_key}"},
+                params={
+                    "query": query,
+                    "per_page": count,
+                    "orientation": "landscape"
+                },
+                timeout=10.0
+            )
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                for photo in data.get('results', []):
+                    asset = VisualAsset(
+                        asset_type='stock',
+                        source_url=photo['urls']['regular'],
+                        local_path=None,
+                        alt_text=photo.get('alt_description', query),
+                        keywords=query.split(),
+                        confidence=0.6  # Stock is lower confidence
+                    )
+                    assets.append(asset)
+                    
         except Exception as e:
-            print(f"[Visual] Unsplash search error: {e}")
+            log.warning("[Visual] Unsplash search error: %s", e)
         
         return assets
     
@@ -152,96 +308,83 @@ class VisualContentGenerator:
         Style: Illustration (not photorealistic) as per user preference.
         """
         if not self.openai_api_key:
-            print("[Visual] No OpenAI API key configured")
+            log.info("[Visual] No OpenAI API key configured")
             return None
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.openai.com/v1/images/generations",
-                    headers={
-                        "Authorization": f"Bearer {self.openai_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "dall-e-3",
-                        "prompt": f"{prompt}. Style: {style}. Flat illustration style, not photorealistic. Friendly, warm colors.",
-                        "size": "1024x1024",
-                        "quality": "standard",
-                        "n": 1
-                    },
-                    timeout=60.0
+            client = get_http_client()
+            response = await client.post(
+                "https://api.openai.com/v1/images/generations",
+                headers={
+                    "Authorization": f"Bearer {self.openai_api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": "dall-e-3",
+                    "prompt": f"{prompt}. Style: {style}. Flat illustration style, not photorealistic. Friendly, warm colors.",
+                    "size": "1024x1024",
+                    "quality": "standard",
+                    "n": 1
+                },
+                timeout=60.0
+            )
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                image_url = data['data'][0]['url']
+                
+                return VisualAsset(
+                    asset_type='ai_illustration',
+                    source_url=image_url,
+                    local_path=None,
+                    alt_text=prompt,
+                    keywords=prompt.split(),
+                    confidence=0.9  # High confidence for custom generation
                 )
+            else:
+                log.warning("[Visual] DALL-E error: %s - %s", response.status_code, response.text)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    image_url = data['data'][0]['url']
-                    
-                    return VisualAsset(
-                        asset_type='ai_illustration',
-                        source_url=image_url,
-                        local_path=None,
-                        alt_text=prompt,
-                        keywords=prompt.split(),
-                        confidence=0.9  # High confidence for custom generation
-                    )
-                else:
-                    print(f"[Visual] DALL-E error: {response.status_code} - {response.text}")
-                    
         except Exception as e:
-            print(f"[Visual] AI generation error: {e}")
+            log.warning("[Visual] AI generation error: %s", e)
         
         return None
     
+    async def save_locally(self, asset: VisualAsset, save_dir: str) -> VisualAsset:
+        """
+        Download an asset's image into save_dir and set its local_path.
+        
+        DALL-E URLs expire after about an hour, so generated images are
+        saved as soon as they exist; on failure local_path stays None.
+        """
+        dest = os.path.join(save_dir, f"{uuid.uuid4()}.png")
+        try:
+            asset.local_path = await fetch_to_disk(asset.source_url, dest)
+        except Exception as e:
+            log.warning("[Visual] Image download failed: %s", e)
+        return asset
+    
     def build_ai_prompt(self, content: str, context: Dict = None) -> str:
         """
         Build an AI illustration prompt from content.
         """
-        keywords = self.extract_visual_keywords(content, context)
-        
-        # Build scene description
-        scene_elements = []
-        
-        if 'dog' in str(keywords).lower():
-            scene_elements.append("a happy dog")
-        
-        if any('jump' in k for k in keywords):
-            scene_elements.append("jumping excitedly")
-        
-        if 'van' in str(keywords).lower() or 'transport' in str(keywords).lower():
-            scene_elements.append("near a friendly dog transport van")
-        
-        if 'happy' in str(keywords).lower() or 'joy' in str(keywords).lower():
-            scene_elements.append("with tail wagging")
-        
-        # Build the prompt
-        base_prompt = " ".join(scene_elements) if scene_elements else "a friendly pet care scene"
-        
-        # Add style modifiers (illustration, not photo)
-        style_modifiers = (
-            "warm, friendly illustration style. "
-            "Bright, cheerful colors. "
-            "Children's book illustration aesthetic. "
-            "Clean lines, flat design, not photorealistic. "
-            "White background or simple environment."
-        )
-        
-        full_prompt = f"{base_prompt}. {style_modifiers}"
-        
-        return full_prompt
+        return _ai_prompt(content)
     
     async def generate_content_visuals(
         self,
         content: str,
         content_type: str = 'social_post',
         client_assets: List[str] = None,  # URLs to client's original images
-        context: Dict = None
+        context: Dict = None,
+        save_dir: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Generate visual assets for content with priority:
         1. Client's original images (if provided)
         2. AI-generated illustrations
         3. Stock images (fallback)
+        
+        With save_dir, AI illustrations are also downloaded there (see
+        save_locally); callers that store local_path pass the project's dir.
         """
         results = {
             'primary_visual': None,
@@ -286,12 +429,19 @@ class VisualContentGenerator:
             results['primary_visual'] = ai_image
             results['sourcing'] = 'ai_illustration'
             
-            # Generate 2 variations
-            for variation in ['different angle', 'different color palette']:
-                var_prompt = f"{ai_prompt} {variation}"
-                var_image = await self.generate_ai_illustration(var_prompt)
-                if var_image:
-                    results['alternatives'].append(var_image)
+            # Generate 2 variations; independent requests, so in parallel
+            var_images = await asyncio.gather(*(
+                self.generate_ai_illustration(f"{ai_prompt} {variation}")
+                for variation in ['different angle', 'different color palette']
+            ))
+            results['alternatives'] = [image for image in var_images if image]
+            
+            # Save before the OpenAI URLs expire; downloads run side by side
+            if save_dir:
+                await asyncio.gather(*(
+                    self.save_locally(image, save_dir)
+                    for image in [ai_image, *results['alternatives']]
+                ))
             
             return results
         
@@ -387,5 +537,6 @@ async def test_visual_generation():
 
 
 if __name__ == "__main__":
-    import asyncio
+    from app.logs import configure_logging
+    configure_logging()
     asyncio.run(test_visual_generation())
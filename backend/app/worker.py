@@ -0,0 +1,166 @@
+"""Celery worker for the video processing pipeline.
+
+Each pipeline stage is its own task. Transcription and analysis are
+chained; the asset stages then run as a group (chord) whose callback marks
+the project completed. Tasks are routed by the resource they mostly wait on:
+
+    gpu  transcription (Whisper)
+    nlp  Kimi analysis, text assets, visual generation
+    cpu  FFmpeg story stitching and clip extraction
+
+Run a worker per queue (or one for all of them):
+    celery -A app.worker:celery_app worker -Q gpu,cpu,nlp --concurrency=2
+
+Workers must see the same TEMP_DIR as the API (shared volume), since
+uploads are written there before processing is queued.
+"""
+
+import asyncio
+from typing import Optional
+
+import httpx
+from celery import Celery, Task, chain, group
+from celery.signals import worker_process_init
+from fastapi import BackgroundTasks
+
+from app.config import get_settings
+
+settings = get_settings()
+
+celery_app = Celery(
+    "fission",
+    broker=settings.redis_url or None,
+    backend=settings.redis_url or None
+)
+celery_app.conf.update(
+    task_acks_late=True,  # Requeue if a worker dies mid-job
+    worker_prefetch_multiplier=1,  # Jobs are long; don't hoard them
+    result_expires=3600,  # Only needed until the asset chord completes
+    task_routes={
+        "fission.transcribe": {"queue": "gpu"},
+        "fission.analyze": {"queue": "nlp"},
+        "fission.story": {"queue": "cpu"},
+        "fission.clips": {"queue": "cpu"},
+        "fission.text_assets": {"queue": "nlp"},
+        "fission.visuals": {"queue": "nlp"},
+        "fission.complete": {"queue": "nlp"},
+    },
+)
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    from app.logs import configure_logging
+    configure_logging()
+
+
+# One event loop per worker process, reused across tasks so that
+# long-lived async clients stay bound to the loop they were created on
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _run(coro):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
+
+
+async def _run_stage(stage, payload):
+    """Run one stage on its own DB session."""
+    from app.cache import init_cache
+    from app.pipeline import run_stage
+
+    init_cache()
+    return await run_stage(stage, payload)
+
+
+class PipelineTask(Task):
+    """Retries transient HTTP errors; marks the project failed once out of retries."""
+    autoretry_for = (httpx.HTTPError,)
+    retry_backoff = True
+    max_retries = 3
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        from app.pipeline import mark_failed
+        payload = args[0] if args else {}
+        if isinstance(payload, list):  # Chord callback gets every branch's payload
+            payload = payload[0] if payload else {}
+        if payload.get("project_id"):
+            mark_failed(payload["project_id"], exc)
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.transcribe")
+def transcribe(self, payload):
+    from app.pipeline import transcribe_stage
+    return _run(_run_stage(transcribe_stage, payload))
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.analyze")
+def analyze(self, payload):
+    from app.pipeline import analyze_stage
+    return _run(_run_stage(analyze_stage, payload))
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.story")
+def story(self, payload):
+    from app.pipeline import story_stage
+    return _run(_run_stage(story_stage, payload))
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.clips")
+def clips(self, payload):
+    from app.pipeline import clips_stage
+    return _run(_run_stage(clips_stage, payload))
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.text_assets")
+def text_assets(self, payload):
+    from app.pipeline import text_assets_stage
+    return _run(_run_stage(text_assets_stage, payload))
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.visuals")
+def visuals(self, payload):
+    from app.pipeline import visuals_stage
+    return _run(_run_stage(visuals_stage, payload))
+
+
+@celery_app.task(base=PipelineTask, bind=True, name="fission.complete")
+def complete(self, payloads):
+    from app.pipeline import complete_stage
+    return _run(_run_stage(complete_stage, payloads[0]))
+
+
+def processing_chain(project_id: str, file_path: str):
+    """Celery canvas for one project; a group followed by a task is a chord."""
+    payload = {"project_id": project_id, "file_path": file_path}
+    return chain(
+        transcribe.s(payload),
+        analyze.s(),
+        group(story.s(), clips.s(), text_assets.s(), visuals.s()),
+        complete.s(),
+    )
+
+
+async def run_processing(project_id: str, file_path: str):
+    """Run the full pipeline in-process; each stage opens its own DB session."""
+    from app.cache import init_cache
+    from app.pipeline import process_video
+
+    init_cache()
+    await process_video(project_id, file_path)
+
+
+def enqueue_processing(project_id: str, file_path: str, background_tasks: BackgroundTasks):
+    """
+    Queue a project for processing.
+
+    Uses the Celery chain when REDIS_URL is configured so jobs survive API
+    restarts and stages scale per queue; otherwise falls back to running
+    in-process after the response.
+    """
+    if settings.redis_url:
+        processing_chain(project_id, file_path).apply_async()
+    else:
+        background_tasks.add_task(run_processing, project_id, file_path)